@@ -36,7 +36,7 @@ IF %errorlevel% neq 0 (
 REM --- Installation Step 2: Main application libraries ---
 echo.
 echo [SETUP] Installing main application dependencies...
-pip install phonemizer PyMuPDF pyinstaller frontend fitz transformers==4.41.2
+pip install phonemizer PyMuPDF pyinstaller frontend fitz transformers==4.41.2 orjson
 IF %errorlevel% neq 0 (
     echo [ERROR] Failed to install main dependencies.
     pause
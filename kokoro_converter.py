@@ -1,18 +1,29 @@
+import multiprocessing
+
+# The frozen build starts the extraction workers as copies of this executable; hand them
+# off to multiprocessing before the torch/TTS imports below are paid for again.
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 import os
 import json
 import threading
+import queue
 import time
-import fitz  # PyMuPDF
+import numpy as np
 from pathlib import Path
 import torch
-import re
-import traceback
+import logging
+import logging.handlers
 import torch.serialization
 import sys
 import subprocess
 import shutil
+import wave
+from concurrent.futures import ProcessPoolExecutor
+from pdf_extract import choose_strategy, extract_pages
 
 # --- Add the necessary imports for the real TTS library ---
 try:
@@ -21,16 +32,255 @@ try:
     from TTS.tts.configs.xtts_config import XttsConfig
     from TTS.tts.models.xtts import XttsAudioConfig, XttsArgs
     from TTS.config.shared_configs import BaseDatasetConfig
+    from TTS.tts.models.vits import Vits
 except ImportError:
     messagebox.showerror("Critical Error", "TTS library not found. Please run 'pip install TTS' in your virtual environment.")
     sys.exit()
 
+# Errors with full tracebacks are written to a small rotating log file next to settings.json.
+# delay=True keeps the extraction worker processes from opening it.
+LOG_FILE = "kokoro_converter.log"
+logger = logging.getLogger(__name__)
+_log_handler = logging.handlers.RotatingFileHandler(LOG_FILE, maxBytes=1_000_000, backupCount=3, encoding="utf-8", delay=True)
+_log_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+logger.addHandler(_log_handler)
+
+# Let cuDNN pick the fastest convolution algorithms (input shapes repeat thanks to the
+# length buckets) and allow TF32 matmuls on Ampere and newer GPUs.
+torch.backends.cudnn.benchmark = True
+torch.backends.cuda.matmul.allow_tf32 = True
+
+# Optional: orjson parses and writes settings.json much faster than the stdlib for long queues.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Optional: ONNX Runtime for running an exported vocoder.
+try:
+    import onnxruntime as ort
+except ImportError:
+    ort = None
+
+# Queued PDFs whose first chunk is extracted ahead of the file being converted.
+PREFETCH_FILES = 2
+
+def _to_pcm16(wav, peak):
+    """Converts a float waveform to int16 samples, with peak at full scale like the TTS library's save_wav."""
+    return (wav * (32767 / max(0.01, peak))).astype(np.int16)
+
+class AudioSink:
+    """
+    Streams float waveform chunks into an output file as 16-bit mono PCM. When encoding, the
+    samples are piped straight into ffmpeg's stdin, so no intermediate audio file is written
+    or re-read. Chunks are normalized to the running peak of the whole file, so the first
+    chunk gets the level save_wav gave and a later, louder chunk never clips.
+    """
+    def __init__(self, path, sample_rate, ffmpeg=None):
+        self.path = path
+        self.peak = 0.0
+        self.proc = None
+        self.wav = None
+        if ffmpeg:
+            command = [
+                ffmpeg,
+                '-hide_banner', '-loglevel', 'error', '-nostats',
+                '-f', 's16le', '-ar', str(sample_rate), '-ac', '1',
+                '-i', 'pipe:0',
+                '-b:a', '192k',
+                '-map_metadata', '-1',
+                # Keep the Xing header (frame count and seek table) and skip the ID3v2 tag so
+                # players can seek and show the duration without scanning the file.
+                '-write_xing', '1',
+                '-id3v2_version', '0',
+                '-y',
+                path
+            ]
+            # A 1 MB pipe buffer keeps the number of write syscalls low for long chunks.
+            self.proc = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, bufsize=1 << 20)
+        else:
+            self.wav = wave.open(path, 'wb')
+            self.wav.setnchannels(1)
+            self.wav.setsampwidth(2)
+            self.wav.setframerate(sample_rate)
+
+    def write(self, wav):
+        wav = np.asarray(wav, dtype=np.float32)
+        self.peak = max(self.peak, float(np.max(np.abs(wav), initial=0.0)))
+        pcm = _to_pcm16(wav, self.peak)
+        if self.proc:
+            self.proc.stdin.write(pcm.tobytes())
+        else:
+            self.wav.writeframes(pcm.tobytes())
+
+    def close(self):
+        if self.proc:
+            self.proc.stdin.close()
+            stderr = self.proc.stderr.read()
+            if self.proc.wait() != 0:
+                raise subprocess.CalledProcessError(self.proc.returncode, self.proc.args, stderr=stderr)
+        else:
+            self.wav.close()
+
+    def abort(self):
+        """Stops writing and removes the partial output file."""
+        try:
+            if self.proc:
+                self.proc.kill()
+                self.proc.wait()
+            else:
+                self.wav.close()
+        finally:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+class CUDAGraphDecoder(torch.nn.Module):
+    """
+    Wraps the VITS waveform decoder and replays it from captured CUDA graphs, so each chunk
+    costs one launch instead of hundreds. Latent frames are zero-padded up to a fixed set of
+    length buckets to reuse one graph per shape; longer inputs run eagerly. The padding sits
+    inside the decoder's receptive field, so the last few hundred samples of each
+    sentence differ slightly from an eager run, which sees only the convolutions' own padding.
+
+    All graphs share one memory pool, which is safe because they are replayed one at a time
+    and each output is copied out right away. At most MAX_GRAPHS shapes are captured; any
+    others run eagerly instead of pinning more activation memory for the life of the process.
+    """
+    BUCKETS = (64, 128, 256, 512)
+    MAX_GRAPHS = 8
+
+    def __init__(self, decoder):
+        super().__init__()
+        self.decoder = decoder
+        self.graphs = {}
+        self.pool = None
+
+    def forward(self, z, g=None):
+        frames = z.shape[-1]
+        bucket = next((b for b in self.BUCKETS if b >= frames), None)
+        if not z.is_cuda or bucket is None:
+            return self.decoder(z, g=g)
+
+        key = (tuple(z.shape[:-1]), bucket, z.dtype, None if g is None else tuple(g.shape))
+        if key not in self.graphs:
+            if len(self.graphs) >= self.MAX_GRAPHS:
+                return self.decoder(z, g=g)
+            self.graphs[key] = self._capture(z, g, bucket)
+        graph, static_z, static_g, static_out = self.graphs[key]
+
+        static_z.zero_()
+        static_z[..., :frames].copy_(z)
+        if static_g is not None:
+            static_g.copy_(g)
+        graph.replay()
+        samples = static_out.shape[-1] // bucket * frames
+        return static_out[..., :samples].clone()
+
+    def _capture(self, z, g, bucket):
+        static_z = torch.zeros(*z.shape[:-1], bucket, dtype=z.dtype, device=z.device)
+        static_g = None if g is None else g.clone()
+
+        # Warm up on a side stream before capturing, as torch.cuda.graph requires.
+        stream = torch.cuda.Stream()
+        stream.wait_stream(torch.cuda.current_stream())
+        with torch.cuda.stream(stream):
+            for _ in range(2):
+                self.decoder(static_z, g=static_g)
+        torch.cuda.current_stream().wait_stream(stream)
+
+        if self.pool is None:
+            self.pool = torch.cuda.graph_pool_handle()
+        graph = torch.cuda.CUDAGraph()
+        with torch.cuda.graph(graph, pool=self.pool):
+            static_out = self.decoder(static_z, g=static_g)
+        return graph, static_z, static_g, static_out
+
+def _mmap_torch_load(original_load):
+    """
+    Wraps torch.load so local checkpoints are memory-mapped instead of copied through
+    anonymous memory. The TTS library opens checkpoints through fsspec, so file objects
+    that point at a local file are re-opened by path.
+    """
+    def load(f, *args, **kwargs):
+        path = f if isinstance(f, (str, os.PathLike)) else getattr(f, "path", None) or getattr(f, "name", None)
+        if "mmap" not in kwargs and isinstance(path, (str, os.PathLike)) and os.path.isfile(path):
+            try:
+                return original_load(path, *args, mmap=True, **kwargs)
+            except (RuntimeError, ValueError):
+                # Legacy (non-zipfile) checkpoints cannot be memory-mapped.
+                pass
+        return original_load(f, *args, **kwargs)
+    return load
+
+class OnnxDecoder(torch.nn.Module):
+    """
+    Runs an exported VITS waveform decoder with ONNX Runtime. The CUDA provider is pinned to
+    a single stream that copies in the default stream, which keeps GPU memory and CPU usage
+    down for the one-request-at-a-time pattern of this app.
+    """
+    def __init__(self, onnx_path, device):
+        super().__init__()
+        providers = ["CPUExecutionProvider"]
+        if device == "cuda":
+            providers.insert(0, ("CUDAExecutionProvider", {
+                "device_id": 0,
+                "has_user_compute_stream": 0,
+                "do_copy_in_default_stream": 1,
+                "cudnn_conv_use_max_workspace": 1,
+            }))
+        self.session = ort.InferenceSession(onnx_path, providers=providers)
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def forward(self, z, g=None):
+        feeds = {"z": z.float().cpu().numpy()}
+        if "g" in self.input_names:
+            feeds["g"] = g.float().cpu().numpy()
+        audio = self.session.run(None, feeds)[0]
+        return torch.from_numpy(audio).to(z.device)
+
+    @staticmethod
+    def export(decoder, onnx_path):
+        """Exports a waveform decoder with dynamic batch and frame axes."""
+        z = torch.randn(1, decoder.conv_pre.in_channels, 64)
+        args, input_names = (z,), ["z"]
+        dynamic_axes = {"z": {0: "batch", 2: "frames"}, "audio": {0: "batch", 2: "samples"}}
+        if hasattr(decoder, "cond_layer"):
+            args += (torch.randn(1, decoder.cond_layer.in_channels, 1),)
+            input_names.append("g")
+            dynamic_axes["g"] = {0: "batch"}
+
+        device = next(decoder.parameters()).device
+        os.makedirs(os.path.dirname(onnx_path), exist_ok=True)
+        with torch.no_grad():
+            torch.onnx.export(
+                decoder,
+                tuple(a.to(device) for a in args),
+                onnx_path,
+                input_names=input_names,
+                output_names=["audio"],
+                dynamic_axes=dynamic_axes,
+                opset_version=17
+            )
+
 # --- Refactored to a more generic TTSEngine class ---
 class TTSEngine:
-    def __init__(self, model_name):
+    # Sentences are padded up to one of these token lengths so each bucket is one batch.
+    TOKEN_BUCKETS = (64, 128, 256)
+
+    def __init__(self, model_name, use_onnx_vocoder=False):
         self.model_name = model_name
         self.model = None
+        self.cached_speakers = None
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        self.use_cuda_graphs = True
+        # Run the VITS vocoder through ONNX Runtime instead of PyTorch (requires onnxruntime).
+        self.use_onnx_vocoder = use_onnx_vocoder
+        # Half precision autocast on the GPU; the CPU path stays in full precision. The cast
+        # cache is disabled: CUDA graphs captured under autocast must not point at cached
+        # fp16 weight copies, which are freed when the autocast block exits.
+        self.precision = "fp16" if self.device == "cuda" else "fp32"
+        # Side stream for host-to-device copies of the next batch's inputs.
+        self.copy_stream = torch.cuda.Stream() if self.device == "cuda" else None
         self.check_installation()
 
     def check_installation(self):
@@ -54,16 +304,45 @@ class TTSEngine:
             torch.serialization.add_safe_globals([XttsConfig, XttsAudioConfig, BaseDatasetConfig, XttsArgs])
 
         print(f"Loading TTS model: {self.model_name}. This may take a moment...")
-        self.model = TTS(self.model_name).to(self.device)
+        original_load = torch.load
+        torch.load = _mmap_torch_load(original_load)
+        try:
+            self.model = TTS(self.model_name).to(self.device)
+        finally:
+            torch.load = original_load
         print("Model loaded successfully.")
+
+        # Only the VITS decoder has a static, control-flow free forward pass that can be
+        # captured; the text frontend and duration predictor keep running eagerly.
+        tts_model = self.model.synthesizer.tts_model
+        if self.use_onnx_vocoder and ort is not None and hasattr(tts_model, "waveform_decoder"):
+            onnx_path = os.path.join("onnx", f"{self.model_name.replace('/', '--')}_vocoder.onnx")
+            if not os.path.exists(onnx_path):
+                print(f"Exporting the vocoder to {onnx_path}...")
+                OnnxDecoder.export(tts_model.waveform_decoder, onnx_path)
+            print("Running the waveform decoder with ONNX Runtime.")
+            tts_model.waveform_decoder = OnnxDecoder(onnx_path, self.device)
+        elif self.device == "cuda" and self.use_cuda_graphs and hasattr(tts_model, "waveform_decoder"):
+            print("Enabling CUDA graph replay for the waveform decoder.")
+            tts_model.waveform_decoder = CUDAGraphDecoder(tts_model.waveform_decoder)
         
         if self.model.is_multi_speaker and hasattr(self.model, 'speakers'):
-            return self.model.speakers
-        return None
+            self.cached_speakers = self.model.speakers
+
+        # Synthesize a throwaway sentence so cuDNN autotuning, CUDA graph capture and lazy
+        # allocations happen now rather than at the start of the first conversion.
+        print("Warming up the model...")
+        try:
+            self.tts_batched("Warmup.", speaker_id=self.cached_speakers[0] if self.cached_speakers else None, return_waveform=True)
+        except Exception as e:
+            print(f"Warm-up skipped: {e}")
+        return self.cached_speakers
 
-    def tts(self, text, output_path, speaker_id=None, speaker_wav_path=None):
+    def tts(self, text, output_path=None, speaker_id=None, speaker_wav_path=None, return_waveform=False):
         """
         Performs text-to-speech conversion. The TTS library handles sentence splitting internally.
+        With return_waveform the audio is returned as (float32 samples, sample_rate) instead of
+        being written to output_path.
         """
         if not self.model:
             raise RuntimeError("TTS model is not loaded. Please load the model first.")
@@ -71,14 +350,116 @@ class TTSEngine:
         print(f"Converting text to speech...")
         
         try:
-            self.model.tts_to_file(
-                text=text,
-                speaker=speaker_id,
-                speaker_wav=speaker_wav_path,
-                language="en", 
-                file_path=output_path
-            )
+            with torch.inference_mode(), torch.autocast(self.device, dtype=torch.float16, enabled=self.precision == "fp16",
+                                                        cache_enabled=False):
+                if return_waveform:
+                    wav = self.model.tts(
+                        text=text,
+                        speaker=speaker_id,
+                        speaker_wav=speaker_wav_path,
+                        language="en"
+                    )
+                else:
+                    self.model.tts_to_file(
+                        text=text,
+                        speaker=speaker_id,
+                        speaker_wav=speaker_wav_path,
+                        language="en", 
+                        file_path=output_path
+                    )
+            print("Conversion successful.")
+            if return_waveform:
+                return np.asarray(wav, dtype=np.float32), self.model.synthesizer.output_sample_rate
+        except Exception as e:
+            print(f"An error occurred during TTS conversion: {e}")
+            raise
+
+    def upload(self, *tensors):
+        """
+        Copies CPU tensors to the device. On CUDA the pinned tensors are copied with
+        non_blocking=True on a dedicated stream; returns (tensors, event) and the compute
+        stream must wait on the event before using them. The event is None elsewhere.
+        """
+        if self.device != "cuda":
+            return tuple(t.to(self.device) for t in tensors), None
+        with torch.cuda.stream(self.copy_stream):
+            uploaded = tuple(t.to(self.device, non_blocking=True) for t in tensors)
+            event = torch.cuda.Event()
+            event.record(self.copy_stream)
+        return uploaded, event
+
+    def tts_batched(self, text, output_path=None, speaker_id=None, speaker_wav_path=None, batch_size=8, return_waveform=False):
+        """
+        Performs text-to-speech conversion with sentences synthesized in padded batches, one
+        forward pass per length bucket instead of one per sentence. Models without batched
+        inference (XTTS-v2, d-vector speakers) fall back to tts(). return_waveform behaves as in tts().
+        """
+        if not self.model:
+            raise RuntimeError("TTS model is not loaded. Please load the model first.")
+
+        synthesizer = self.model.synthesizer
+        tts_model = synthesizer.tts_model
+        if not isinstance(tts_model, Vits) or getattr(synthesizer.tts_config, "use_d_vector_file", False):
+            return self.tts(text, output_path, speaker_id=speaker_id, speaker_wav_path=speaker_wav_path, return_waveform=return_waveform)
+
+        print(f"Converting text to speech in batches...")
+
+        try:
+            sentences = [s for s in synthesizer.split_into_sentences(text) if s.strip()]
+            token_ids = [tts_model.tokenizer.text_to_ids(s) for s in sentences]
+
+            buckets = {}
+            for index, ids in enumerate(token_ids):
+                size = next((b for b in self.TOKEN_BUCKETS if b >= len(ids)), len(ids))
+                buckets.setdefault(size, []).append(index)
+
+            sid = None
+            if speaker_id is not None and tts_model.speaker_manager is not None:
+                sid = tts_model.speaker_manager.name_to_id[speaker_id]
+
+            batches = [(size, indices[start:start + batch_size]) for size, indices in buckets.items() for start in range(0, len(indices), batch_size)]
+
+            def upload(size, batch):
+                pin = self.device == "cuda"
+                x = torch.zeros(len(batch), size, dtype=torch.long, pin_memory=pin)
+                for row, index in enumerate(batch):
+                    x[row, :len(token_ids[index])] = torch.tensor(token_ids[index], dtype=torch.long)
+                x_lengths = torch.tensor([len(token_ids[i]) for i in batch], dtype=torch.long)
+                return self.upload(x, x_lengths.pin_memory() if pin else x_lengths)
+
+            wavs = [None] * len(token_ids)
+            with torch.inference_mode(), torch.autocast(self.device, dtype=torch.float16, enabled=self.precision == "fp16",
+                                                        cache_enabled=False):
+                # Double buffering: the next batch is copied to the GPU on a side stream while
+                # the current one is being synthesized.
+                next_upload = upload(*batches[0]) if batches else None
+                for number, (size, batch) in enumerate(batches):
+                    (x, x_lengths), ready = next_upload
+                    next_upload = upload(*batches[number + 1]) if number + 1 < len(batches) else None
+                    if ready is not None:
+                        stream = torch.cuda.current_stream()
+                        stream.wait_event(ready)
+                        x.record_stream(stream)
+                        x_lengths.record_stream(stream)
+
+                    aux_input = {"x_lengths": x_lengths}
+                    if sid is not None:
+                        aux_input["speaker_ids"] = torch.full((len(batch),), sid, dtype=torch.long, device=self.device)
+
+                    outputs = tts_model.inference(x, aux_input=aux_input)
+                    audio = outputs["model_outputs"].float()
+                    hop_length = audio.shape[-1] // outputs["y_mask"].shape[-1]
+                    frames = outputs["y_mask"].sum(dim=(1, 2)).long().tolist()
+                    for row, index in enumerate(batch):
+                        wavs[index] = audio[row, 0, :frames[row] * hop_length].cpu().numpy()
+
+            # Same 10000 sample pause between sentences that the TTS library inserts.
+            silence = np.zeros(10000, dtype=np.float32)
+            wav = np.concatenate([part for w in wavs for part in (w, silence)]) if wavs else silence
             print("Conversion successful.")
+            if return_waveform:
+                return wav, synthesizer.output_sample_rate
+            synthesizer.save_wav(wav, output_path)
         except Exception as e:
             print(f"An error occurred during TTS conversion: {e}")
             raise
@@ -95,6 +476,16 @@ class PDFConverterApp:
         self.is_running = False
         self.is_paused = False
         self.conversion_thread = None
+        # Worker processes that extract PDF text ahead of the file currently being synthesized.
+        # On Linux they are forked from a fork server, a fresh interpreter that preloads only
+        # pdf_extract, so neither this Tk process nor torch is copied into them. Windows and
+        # macOS spawn them; the frozen build hands them off in freeze_support() at the top.
+        if sys.platform.startswith('linux'):
+            context = multiprocessing.get_context('forkserver')
+            context.set_forkserver_preload(['pdf_extract'])
+            self.extract_pool = ProcessPoolExecutor(max_workers=2, mp_context=context)
+        else:
+            self.extract_pool = ProcessPoolExecutor(max_workers=2)
         
         self.available_tts_models = {
             "VCTK (Multi-Voice)": "tts_models/en/vctk/vits",
@@ -105,10 +496,21 @@ class PDFConverterApp:
         self.selected_voice = tk.StringVar()
         self.speaker_wav_path = tk.StringVar()
         self.optimize_mp3 = tk.BooleanVar(value=True)
+        self.onnx_vocoder = tk.BooleanVar(value=False)
         
         self.tts_engine = None
+        self.ffmpeg_path = None
+        self._engine_cache = {}
+        self.voice_display_to_id = {}
+        # Row ids whose status changed and still need to be redrawn in the Treeview. The
+        # conversion stages add to it while the Tk thread swaps it out, so both hold the lock.
+        self._dirty = set()
+        self._refresh_pending = False
+        self._refresh_lock = threading.Lock()
 
         self.load_settings()
+        # Normalized paths of everything in the queue, for O(1) duplicate checks.
+        self.pdf_queue_paths = {os.path.normpath(item["path"]) for item in self.pdf_queue}
         
         self.setup_ui()
         self.update_pdf_list()
@@ -117,7 +519,9 @@ class PDFConverterApp:
 
     def check_ffmpeg(self):
         """Checks if ffmpeg is installed and in the system's PATH."""
-        if shutil.which("ffmpeg"):
+        # Resolved once; the conversion stages reuse the full path instead of searching PATH per file.
+        self.ffmpeg_path = shutil.which("ffmpeg")
+        if self.ffmpeg_path:
             self.log("FFmpeg found. MP3 optimization is available.")
         else:
             self.log("WARNING: FFmpeg not found. The 'Optimize MP3' feature will be disabled.")
@@ -162,6 +566,11 @@ class PDFConverterApp:
         optimize_frame.pack(fill="x")
         self.optimize_checkbox = ttk.Checkbutton(optimize_frame, text="Optimize MP3 for Fast Opening (Requires FFmpeg)", variable=self.optimize_mp3)
         self.optimize_checkbox.pack(anchor="w")
+        self.onnx_checkbox = ttk.Checkbutton(optimize_frame, text="Run the VITS Vocoder with ONNX Runtime (Applies on Model Load)", variable=self.onnx_vocoder)
+        self.onnx_checkbox.pack(anchor="w")
+        if ort is None:
+            self.onnx_vocoder.set(False)
+            self.onnx_checkbox.config(state="disabled")
 
 
         list_frame = ttk.Frame(main_frame)
@@ -233,27 +642,33 @@ class PDFConverterApp:
             return
             
         model_path = self.available_tts_models[model_key]
-        self.tts_engine = TTSEngine(model_path)
+        use_onnx_vocoder = self.onnx_vocoder.get()
+        # Loaded engines stay on the device, so switching back to a model is instant.
+        if (model_path, use_onnx_vocoder) in self._engine_cache:
+            self.tts_engine = self._engine_cache[model_path, use_onnx_vocoder]
+            self.log(f"Using already loaded model {model_key}.")
+            self.update_model_status(True, speakers=self.tts_engine.cached_speakers)
+            return
+
+        self.tts_engine = TTSEngine(model_path, use_onnx_vocoder=use_onnx_vocoder)
         
         self.load_model_button.config(state="disabled")
         self.model_dropdown.config(state="disabled")
         self.log(f"Model loading initiated for {model_key}...")
         
-        load_thread = threading.Thread(target=self.load_model_task, daemon=True)
+        load_thread = threading.Thread(target=self.load_model_task, args=(self.tts_engine,), daemon=True)
         load_thread.start()
 
-    def load_model_task(self):
+    def load_model_task(self, engine):
         """The actual task of loading the model. To be run in a thread."""
         try:
-            speakers = self.tts_engine.load_model()
+            speakers = engine.load_model()
+            self._engine_cache[engine.model_name, engine.use_onnx_vocoder] = engine
             self.root.after(0, lambda: self.update_model_status(True, speakers=speakers))
         except Exception as e:
-            error_details = traceback.format_exc()
-            print("--- EXCEPTION CAUGHT DURING MODEL LOAD ---")
-            print(error_details)
-            print("------------------------------------------")
-            full_error_msg = f"An error occurred during model loading. Please see the console for the full traceback.\n\nError: {e}"
-            self.root.after(0, lambda: self.update_model_status(False, error_msg=full_error_msg))
+            # The full traceback goes to the log file; only a short summary is posted to Tk.
+            logger.exception("Model load failed")
+            self.root.after(0, self.update_model_status, False, None, f"{str(e)[:500]}\n\nThe full traceback was written to {LOG_FILE}.")
 
     def update_model_status(self, success, speakers=None, error_msg=None):
         self.load_model_button.config(state="normal")
@@ -263,7 +678,8 @@ class PDFConverterApp:
             self.start_button.config(state="normal")
             self.log("TTS model loaded successfully.")
             if self.tts_engine.model.is_multi_speaker and speakers:
-                formatted_voices = [f"Speaker {i+1} ({speaker_id})" for i, speaker_id in enumerate(speakers)]
+                self.voice_display_to_id = {f"Speaker {i+1} ({speaker_id})": speaker_id for i, speaker_id in enumerate(speakers)}
+                formatted_voices = list(self.voice_display_to_id)
                 self.vctk_voice_dropdown.config(state="readonly", values=formatted_voices)
                 saved_voice = self.selected_voice.get()
                 if saved_voice and saved_voice in formatted_voices:
@@ -273,6 +689,7 @@ class PDFConverterApp:
                 self.log(f"Found {len(speakers)} voices.")
             else:
                 self.vctk_voice_dropdown.config(state="disabled", values=[])
+                self.voice_display_to_id = {}
                 self.selected_voice.set("")
         else:
             # --- CHANGE: Ensure start button remains disabled on failure ---
@@ -293,13 +710,16 @@ class PDFConverterApp:
         directory = filedialog.askdirectory(title="Select Folder with PDFs")
         if directory:
             added_files = 0
-            for root_dir, _, files in os.walk(directory):
-                for file in files:
-                    if file.lower().endswith(".pdf"):
-                        file_path = os.path.join(root_dir, file)
-                        if not any(item["path"] == file_path for item in self.pdf_queue):
-                            self.pdf_queue.append({"status": "Pending", "path": file_path, "filename": file})
-                            added_files += 1
+            # rglob("*") plus a suffix check keeps the case-insensitive ".pdf" match on every platform.
+            for path in Path(directory).rglob("*"):
+                if path.suffix.lower() != ".pdf" or not path.is_file():
+                    continue
+                file_path = str(path)
+                if os.path.normpath(file_path) in self.pdf_queue_paths:
+                    continue
+                self.pdf_queue.append({"status": "Pending", "path": file_path, "filename": path.name})
+                self.pdf_queue_paths.add(os.path.normpath(file_path))
+                added_files += 1
             if added_files > 0:
                 self.update_pdf_list()
                 self.log(f"Added {added_files} new PDF(s) from {directory}")
@@ -316,8 +736,30 @@ class PDFConverterApp:
 
     def update_pdf_list(self):
         self.pdf_tree.delete(*self.pdf_tree.get_children())
-        for item in self.pdf_queue:
-            self.pdf_tree.insert("", "end", values=(item["status"], os.path.dirname(item["path"]), item["filename"]))
+        for i, item in enumerate(self.pdf_queue):
+            item["iid"] = self.pdf_tree.insert("", "end", iid=str(i), values=(item["status"], os.path.dirname(item["path"]), item["filename"]))
+
+    def refresh_item(self, item):
+        """
+        Queues a redraw of one row. Changes made within 100 ms are applied in a single pass.
+        Safe to call from any thread.
+        """
+        with self._refresh_lock:
+            self._dirty.add(item.get("iid"))
+            if self._refresh_pending:
+                return
+            self._refresh_pending = True
+        self.root.after(100, self._flush_refresh)
+
+    def _flush_refresh(self):
+        with self._refresh_lock:
+            self._refresh_pending = False
+            dirty, self._dirty = self._dirty, set()
+        for iid in dirty:
+            if iid is None or not self.pdf_tree.exists(iid):
+                continue
+            item = self.pdf_queue[int(iid)]
+            self.pdf_tree.item(iid, values=(item["status"], os.path.dirname(item["path"]), item["filename"]))
 
     def move_item(self, direction):
         selected = self.pdf_tree.focus()
@@ -340,6 +782,7 @@ class PDFConverterApp:
         if messagebox.askyesno("Confirm Delete", "Are you sure you want to remove the selected files from the list?"):
             indices_to_delete = sorted([self.pdf_tree.index(i) for i in selected_items], reverse=True)
             for index in indices_to_delete:
+                self.pdf_queue_paths.discard(os.path.normpath(self.pdf_queue[index]["path"]))
                 del self.pdf_queue[index]
             self.update_pdf_list()
             self.log(f"Removed {len(selected_items)} file(s) from the list.")
@@ -394,106 +837,232 @@ class PDFConverterApp:
         speaker_wav = self.speaker_wav_path.get()
         
         if self.tts_engine.model.is_multi_speaker:
-            selected_speaker_formatted = self.selected_voice.get()
-            speaker_id_match = re.search(r'\(p\d+\)', selected_speaker_formatted)
-            if speaker_id_match and hasattr(self.tts_engine.model, 'speakers'):
-                speaker_id = speaker_id_match.group(0).strip('()')
-            elif hasattr(self.tts_engine.model, 'speakers'):
-                speaker_id = self.tts_engine.model.speakers[0]
-
-        for i in range(len(self.pdf_queue) - 1, -1, -1):
-            if not self.is_running: break
-            while self.is_paused:
-                if not self.is_running: break
-                time.sleep(1)
+            speakers = self.tts_engine.cached_speakers
+            speaker_id = self.voice_display_to_id.get(self.selected_voice.get(), speakers[0] if speakers else None)
 
-            item = self.pdf_queue[i]
-            if item["status"] == "Complete": continue
+        # Extraction, synthesis and ffmpeg run as separate stages connected by bounded
+        # queues, so the next PDF is parsed while the GPU synthesizes and ffmpeg encodes
+        # the previous one. The queue is processed from the bottom up.
+        pending = [item for item in reversed(self.pdf_queue) if item["status"] != "Complete"]
+        synth_q, done_q = queue.Queue(2), queue.Queue(2)
+        stages = [
+            threading.Thread(target=self._extract_stage, args=(pending, synth_q), daemon=True),
+            threading.Thread(target=self._synth_stage, args=(synth_q, done_q, speaker_id, speaker_wav), daemon=True),
+            threading.Thread(target=self._ffmpeg_stage, args=(done_q,), daemon=True),
+        ]
+        for stage in stages:
+            stage.start()
+        for stage in stages:
+            stage.join()
+
+        if self.is_running:
+            self.log("All tasks completed.")
+            self.root.after(0, self.stop_conversion)
+
+    def wait_while_paused(self):
+        """Blocks while the conversion is paused. Returns False once it has been stopped."""
+        while self.is_paused and self.is_running:
+            time.sleep(1)
+        return self.is_running
+
+    def fail_item(self, item, error):
+        item["status"] = "Error"
+        self.log(f"ERROR processing {item['filename']}: {error}")
+        self.refresh_item(item)
+
+    def output_base_path(self, item):
+        """Returns the destination path, without extension, for a queue item."""
+        folder_name = os.path.basename(os.path.dirname(item['path']))
+        safe_folder_name = "".join(c for c in folder_name if c.isalnum() or c in (' ', '_')).rstrip()
+        base_filename = f"{safe_folder_name}_{os.path.splitext(item['filename'])[0]}"
+        return os.path.join(self.destination_folder, base_filename)
+
+    def iter_text_chunks(self, path, first=None):
+        """
+        Yields (chunk, n_chunks, text) for a PDF, extracting page ranges in the worker pool.
+        Only one chunk of text is held at a time, so synthesis starts before a whole book is
+        parsed; large books keep the next chunks extracting in the background. first is an
+        already submitted extract_pages(path) future for the first chunk, if any.
+        """
+        if first is None:
+            first = self.extract_pool.submit(extract_pages, path)
+        text, first_stop, page_count = first.result()
+        chunk_pages, use_procs = choose_strategy(page_count)
+        ranges = [(0, first_stop)] + [(start, min(start + chunk_pages, page_count)) for start in range(first_stop, page_count, chunk_pages)]
+        if len(ranges) > 1:
+            self.log(f"{page_count} pages, synthesizing in {len(ranges)} chunks of up to {chunk_pages} pages.")
+        else:
+            self.log("Text extraction complete.")
+
+        futures = {}
+
+        def submit(chunk):
+            if chunk < len(ranges) and chunk not in futures:
+                futures[chunk] = self.extract_pool.submit(extract_pages, path, *ranges[chunk])
+
+        try:
+            for chunk, (start, stop) in enumerate(ranges):
+                if use_procs:
+                    submit(chunk + 1)
+                    submit(chunk + 2)
+                if chunk > 0:
+                    submit(chunk)
+                    text = futures.pop(chunk).result()[0]
+                if len(ranges) > 1:
+                    self.log(f"Chunk {chunk + 1}/{len(ranges)}: pages {start + 1}-{stop}")
+                yield chunk, len(ranges), text
+                text = None
+        finally:
+            for future in futures.values():
+                future.cancel()
+
+    def _extract_stage(self, pending, synth_q):
+        # The first chunk of the next PREFETCH_FILES PDFs is extracted in the worker pool
+        # while the current file is still being parsed and synthesized.
+        prefetched = {}
+
+        def prefetch(index):
+            if index < len(pending) and index not in prefetched:
+                prefetched[index] = self.extract_pool.submit(extract_pages, pending[index]["path"])
+
+        try:
+            for index, item in enumerate(pending):
+                if not self.is_running: break
+                for ahead in range(PREFETCH_FILES + 1):
+                    prefetch(index + ahead)
+                if not self.wait_while_paused(): continue
 
-            try:
                 self.log(f"Processing: {item['filename']}")
                 item["status"] = "Processing"
-                self.root.after(0, self.update_pdf_list)
-
+                self.refresh_item(item)
                 self.log(f"Extracting text from {item['filename']}...")
-                doc = fitz.open(item["path"])
-                text = "".join(page.get_text() for page in doc)
-                doc.close()
-                self.log("Text extraction complete.")
-                
-                folder_name = os.path.basename(os.path.dirname(item['path']))
-                safe_folder_name = "".join(c for c in folder_name if c.isalnum() or c in (' ', '_')).rstrip()
-                
-                base_filename = f"{safe_folder_name}_{os.path.splitext(item['filename'])[0]}"
-                temp_output_path = os.path.join(self.destination_folder, f"{base_filename}_temp.mp3")
-                final_output_path = os.path.join(self.destination_folder, f"{base_filename}.mp3")
-                
-                self.tts_engine.tts(text, temp_output_path, speaker_id=speaker_id, speaker_wav_path=speaker_wav)
-                
-                if self.optimize_mp3.get() and shutil.which("ffmpeg"):
-                    self.log("Optimizing MP3 for fast opening with FFmpeg...")
-                    command = [
-                        'ffmpeg',
-                        '-i', temp_output_path,
-                        '-b:a', '192k',
-                        '-map_metadata', '-1',
-                        '-y',
-                        final_output_path
-                    ]
-                    subprocess.run(command, check=True, capture_output=True)
-                    os.remove(temp_output_path)
-                    self.log("Optimization complete.")
-                else:
-                    os.rename(temp_output_path, final_output_path)
+                chunks = self.iter_text_chunks(item["path"], prefetched.pop(index))
+                try:
+                    for chunk, n_chunks, text in chunks:
+                        if item["status"] != "Processing": break
+                        if not self.wait_while_paused():
+                            # Stopped partway through a book; leave it for the next run.
+                            item["status"] = "Pending"
+                            self.refresh_item(item)
+                            break
+                        synth_q.put((item, chunk, n_chunks, text))
+                except Exception as e:
+                    self.fail_item(item, e)
+                    synth_q.put((item, None, None, None))
+                finally:
+                    # Cancels the chunks of this file still queued in the worker pool.
+                    chunks.close()
+        finally:
+            for future in prefetched.values():
+                future.cancel()
+        synth_q.put(None)
+
+    def _synth_stage(self, synth_q, done_q, speaker_id, speaker_wav):
+        while True:
+            message = synth_q.get()
+            if message is None: break
+            item, chunk, n_chunks, text = message
+
+            if chunk == 0 and not self.wait_while_paused():
+                # Stopped before this file started synthesizing; leave it for the next run.
+                item["status"] = "Pending"
+                self.refresh_item(item)
+
+            waveform = None
+            if text and text.strip() and item["status"] == "Processing":
+                try:
+                    waveform = self.tts_engine.tts_batched(text, speaker_id=speaker_id, speaker_wav_path=speaker_wav, return_waveform=True)
+                except Exception as e:
+                    self.fail_item(item, e)
+            done_q.put((item, chunk, n_chunks, waveform))
+        done_q.put(None)
+
+    def _ffmpeg_stage(self, done_q):
+        sinks = {}
+        while True:
+            message = done_q.get()
+            if message is None: break
+            item, chunk, n_chunks, waveform = message
 
-                item["status"] = "Complete"
-                self.log(f"Successfully converted {item['filename']}")
+            try:
+                if item["status"] != "Processing":
+                    if id(item) in sinks:
+                        sinks.pop(id(item)).abort()
+                    continue
+
+                # Chunks without any text arrive without a waveform and are skipped.
+                if waveform is not None:
+                    wav, sample_rate = waveform
+                    if id(item) not in sinks:
+                        final_output_path = f"{self.output_base_path(item)}.mp3"
+                        if self.optimize_mp3.get() and self.ffmpeg_path:
+                            self.log("Encoding MP3 with FFmpeg...")
+                            sinks[id(item)] = AudioSink(final_output_path, sample_rate, ffmpeg=self.ffmpeg_path)
+                        else:
+                            sinks[id(item)] = AudioSink(final_output_path, sample_rate)
+                    sinks[id(item)].write(wav)
+
+                if chunk == n_chunks - 1:
+                    if id(item) in sinks:
+                        sinks.pop(id(item)).close()
+                        item["status"] = "Complete"
+                        self.log(f"Successfully converted {item['filename']}")
+                    else:
+                        item["status"] = "Skipped"
+                        self.log(f"No extractable text in {item['filename']} (scanned PDF?), skipping.")
+                    self.refresh_item(item)
             except Exception as e:
-                item["status"] = "Error"
-                self.log(f"ERROR processing {item['filename']}: {e}")
-                if 'temp_output_path' in locals() and os.path.exists(temp_output_path):
-                    os.remove(temp_output_path)
-            self.root.after(0, self.update_pdf_list)
+                if id(item) in sinks:
+                    sinks.pop(id(item)).abort()
+                self.fail_item(item, e)
 
-        if self.is_running:
-            self.log("All tasks completed.")
-            self.root.after(0, self.stop_conversion)
+        for sink in sinks.values():
+            sink.abort()
 
     def load_settings(self):
         if os.path.exists(self.settings_file):
             try:
-                with open(self.settings_file, 'r') as f:
-                    settings = json.load(f)
+                with open(self.settings_file, 'rb') as f:
+                    data = f.read()
+                    settings = orjson.loads(data) if orjson else json.loads(data)
                     self.pdf_queue = settings.get("pdf_queue", [])
                     self.destination_folder = settings.get("destination_folder", self.destination_folder)
                     self.selected_voice.set(settings.get("selected_voice", ""))
                     self.speaker_wav_path.set(settings.get("speaker_wav_path", ""))
                     self.selected_tts_model.set(settings.get("selected_tts_model", list(self.available_tts_models.keys())[0]))
                     self.optimize_mp3.set(settings.get("optimize_mp3", True))
+                    self.onnx_vocoder.set(settings.get("onnx_vocoder", False))
             except json.JSONDecodeError:
                 self.log("Could not read settings.json, it might be corrupted. Starting fresh.")
                 self.pdf_queue = []
 
     def save_settings(self):
         settings = {
-            "pdf_queue": self.pdf_queue,
+            "pdf_queue": [{k: v for k, v in item.items() if k != "iid"} for item in self.pdf_queue],
             "destination_folder": self.destination_folder,
             "selected_voice": self.selected_voice.get(),
             "speaker_wav_path": self.speaker_wav_path.get(),
             "selected_tts_model": self.selected_tts_model.get(),
-            "optimize_mp3": self.optimize_mp3.get()
+            "optimize_mp3": self.optimize_mp3.get(),
+            "onnx_vocoder": self.onnx_vocoder.get()
         }
-        with open(self.settings_file, 'w') as f:
-            json.dump(settings, f, indent=4)
+        if orjson:
+            with open(self.settings_file, 'wb') as f:
+                f.write(orjson.dumps(settings, option=orjson.OPT_INDENT_2))
+        else:
+            with open(self.settings_file, 'w') as f:
+                json.dump(settings, f, indent=4)
 
     def on_closing(self):
         if self.is_running:
             if messagebox.askyesno("Confirm Quit", "Conversion is in progress. Are you sure you want to stop and quit?"):
                 self.stop_conversion()
                 self.save_settings()
+                self.extract_pool.shutdown(wait=False, cancel_futures=True)
                 self.root.destroy()
         else:
             self.save_settings()
+            self.extract_pool.shutdown(wait=False, cancel_futures=True)
             self.root.destroy()
 
 if __name__ == "__main__":
@@ -60,6 +60,7 @@ a = Analysis(
         'kokoro.pipeline',
         'numpy',
         'soundfile',
+        'orjson',
         'spacy',
         'phonemizer',
         'phonemizer.backend',
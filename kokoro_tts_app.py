@@ -6,8 +6,10 @@ Supports NVIDIA RTX 5080 and other CUDA-compatible GPUs.
 
 import sys
 import os
+import io
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, scrolledtext
+import tkinter.font as tkfont
 import threading
 import shutil
 from pathlib import Path
@@ -18,6 +20,11 @@ import traceback
 import re
 import logging
 import json
+import queue
+import functools
+import tempfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 # Early multiprocessing guard for Windows
 if __name__ == "__main__":
@@ -31,118 +38,133 @@ if __name__ == "__main__":
         except:
             pass
 
+_IS_WIN = sys.platform.startswith('win')
+_IS_MAC = sys.platform.startswith('darwin')
+
+# Process umask, read once while start-up is still single-threaded (os.umask can only be
+# read by setting it); output files get the same mode a plain open() would give them
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
 # Set environment variables for Windows
-if sys.platform.startswith('win'):
+if _IS_WIN:
     os.environ['PYTHONW'] = '1'
     os.environ['_MP_FORK_EXEC_'] = '1'
 
+# CUDA caching allocator settings must be in place before torch is imported
+os.environ.setdefault('PYTORCH_CUDA_ALLOC_CONF', 'expandable_segments:True,max_split_size_mb:256')
+
 # Fix for PyInstaller windowed mode: sys.stderr may be None
 # This must be done BEFORE importing kokoro (which uses loguru)
 if getattr(sys, 'frozen', False):
     # Running as PyInstaller executable
     if sys.stderr is None:
-        import io
         sys.stderr = io.StringIO()
     if sys.stdout is None:
-        import io
         sys.stdout = io.StringIO()
-    
-    # Fix for spaCy model loading in PyInstaller
-    # Add the _internal directory to sys.path so spaCy can find the model
-    if hasattr(sys, '_MEIPASS'):
-        sys.path.insert(0, sys._MEIPASS)
-        # Also try to import en_core_web_sm if it's bundled
-        try:
-            import en_core_web_sm
-            # Ensure spaCy can find the model by adding it to sys.path
-            en_core_path = os.path.dirname(en_core_web_sm.__file__)
-            if en_core_path not in sys.path:
-                sys.path.insert(0, en_core_path)
-        except ImportError:
-            pass
-        
-        # Monkey-patch spaCy's load function to look in PyInstaller bundle
-        # This must be done BEFORE kokoro imports spacy
-        # Import spacy early and patch it
-        import spacy
-        import spacy.util
-        original_load = spacy.load
-        original_load_model = spacy.util.load_model
-        
-        def patched_load(name, **kwargs):
-            # First try the original load
-            try:
-                return original_load(name, **kwargs)
-            except OSError as e:
-                # If it fails, try to find the model in the bundle
-                if hasattr(sys, '_MEIPASS'):
-                    # Try direct path
-                    model_path = os.path.join(sys._MEIPASS, name)
-                    if os.path.exists(model_path):
-                        return original_load(model_path, **kwargs)
-                    # Try as a package (en_core_web_sm)
-                    try:
-                        model_module = __import__(name)
-                        model_dir = os.path.dirname(model_module.__file__)
-                        if os.path.exists(model_dir):
-                            return original_load(model_dir, **kwargs)
-                    except ImportError:
-                        pass
-                # Re-raise the original error
-                raise
-        
-        def patched_load_model(name, **kwargs):
-            # First try the original load_model
-            try:
-                return original_load_model(name, **kwargs)
-            except OSError as e:
-                # If it fails, try to find the model in the bundle
-                if hasattr(sys, '_MEIPASS'):
-                    # Try direct path
-                    model_path = os.path.join(sys._MEIPASS, name)
-                    if os.path.exists(model_path):
-                        return original_load_model(model_path, **kwargs)
-                    # Try as a package (en_core_web_sm)
-                    try:
-                        model_module = __import__(name)
-                        model_dir = os.path.dirname(model_module.__file__)
-                        if os.path.exists(model_dir):
-                            return original_load_model(model_dir, **kwargs)
-                    except ImportError:
-                        pass
-                # Re-raise the original error
-                raise
-        
-        spacy.load = patched_load
-        spacy.util.load_model = patched_load_model
 
-# Import PyTorch first (required for device detection)
+# loguru ships with kokoro; app and Kokoro messages both go through it to the console
 try:
-    import torch
-    TORCH_AVAILABLE = True
+    from loguru import logger as loguru_logger
 except ImportError:
-    TORCH_AVAILABLE = False
-    torch = None
-    try:
-        print("Warning: PyTorch not available")
-    except:
-        pass
+    loguru_logger = None
 
-# Import Kokoro and dependencies
+# Optional: orjson serializes the settings (including long text inputs) much faster than json
 try:
-    if TORCH_AVAILABLE:
-        from kokoro import KPipeline
-        KOKORO_AVAILABLE = True
-    else:
-        KOKORO_AVAILABLE = False
-        KPipeline = None
-except ImportError as e:
-    KOKORO_AVAILABLE = False
-    KPipeline = None
+    import orjson
+except ImportError:
+    orjson = None
+
+# torch and kokoro take seconds to import, so the app imports them on a background thread
+# (import_backends) after the window is up. They stay None until then.
+torch = None
+KModel = None
+KPipeline = None
+
+
+def import_backends():
+    """Import PyTorch and Kokoro into the module globals; raises ImportError if missing."""
+    global torch, KModel, KPipeline
+    import torch as torch_module
+    patch_spacy_for_bundle()
+    from kokoro import KModel as model_class, KPipeline as pipeline_class
+    torch = torch_module
+    KModel = model_class
+    KPipeline = pipeline_class
+
+
+def patch_spacy_for_bundle():
+    """Fix for spaCy model loading in PyInstaller.
+    
+    Adds the _internal directory to sys.path so spaCy can find the model.
+    """
+    if not (getattr(sys, 'frozen', False) and hasattr(sys, '_MEIPASS')):
+        return
+    sys.path.insert(0, sys._MEIPASS)
+    # Also try to import en_core_web_sm if it's bundled
     try:
-        print(f"Error: Kokoro not available: {e}")
-    except:
+        import en_core_web_sm
+        # Ensure spaCy can find the model by adding it to sys.path
+        en_core_path = os.path.dirname(en_core_web_sm.__file__)
+        if en_core_path not in sys.path:
+            sys.path.insert(0, en_core_path)
+    except ImportError:
         pass
+    
+    # Monkey-patch spaCy's load function to look in PyInstaller bundle
+    # This must be done BEFORE kokoro imports spacy
+    import spacy
+    import spacy.util
+    original_load = spacy.load
+    original_load_model = spacy.util.load_model
+    
+    def patched_load(name, **kwargs):
+        # First try the original load
+        try:
+            return original_load(name, **kwargs)
+        except OSError as e:
+            # If it fails, try to find the model in the bundle
+            if hasattr(sys, '_MEIPASS'):
+                # Try direct path
+                model_path = os.path.join(sys._MEIPASS, name)
+                if os.path.exists(model_path):
+                    return original_load(model_path, **kwargs)
+                # Try as a package (en_core_web_sm)
+                try:
+                    model_module = __import__(name)
+                    model_dir = os.path.dirname(model_module.__file__)
+                    if os.path.exists(model_dir):
+                        return original_load(model_dir, **kwargs)
+                except ImportError:
+                    pass
+            # Re-raise the original error
+            raise
+    
+    def patched_load_model(name, **kwargs):
+        # First try the original load_model
+        try:
+            return original_load_model(name, **kwargs)
+        except OSError as e:
+            # If it fails, try to find the model in the bundle
+            if hasattr(sys, '_MEIPASS'):
+                # Try direct path
+                model_path = os.path.join(sys._MEIPASS, name)
+                if os.path.exists(model_path):
+                    return original_load_model(model_path, **kwargs)
+                # Try as a package (en_core_web_sm)
+                try:
+                    model_module = __import__(name)
+                    model_dir = os.path.dirname(model_module.__file__)
+                    if os.path.exists(model_dir):
+                        return original_load_model(model_dir, **kwargs)
+                except ImportError:
+                    pass
+            # Re-raise the original error
+            raise
+    
+    spacy.load = patched_load
+    spacy.util.load_model = patched_load_model
+
 
 # Kokoro voice options (all available voices)
 KOKORO_VOICES = [
@@ -154,6 +176,168 @@ KOKORO_VOICES = [
 
 # Log levels for filtering
 LOG_LEVELS = ["ALL", "DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"]
+LEVEL_ORDER = {"DEBUG": 0, "INFO": 1, "WARNING": 2, "ERROR": 3, "CRITICAL": 4}
+
+# Text statistics patterns: one match per non-empty sentence, one per word or punctuation mark
+_SENT_RE = re.compile(r'[^.!?\s][^.!?]*')
+_TOK_RE = re.compile(r'\b\w+\b|[^\w\s]')
+
+# KPipeline's default split: three newlines separate independently phonemized passages
+_SPLIT_RE = re.compile(r'\n\n\n')
+
+# Hugging Face repo of the PyTorch weights, voices and phoneme vocabulary
+KOKORO_REPO_ID = "hexgrad/Kokoro-82M"
+
+# Inference backends: PyTorch KModel, or the ONNX export through ONNX Runtime
+BACKENDS = ["torch", "onnx"]
+
+# MP3 presets -> libmp3lame VBR quality (-q:a): Fast ~115kbps, Quality ~190kbps
+MP3_PRESETS = {"Quality": 2, "Fast": 6}
+
+
+# Command that opens a file or folder with its default application (unused on Windows)
+_OPEN_COMMAND = 'open' if _IS_MAC else 'xdg-open'
+
+
+def open_in_system(path):
+    """Open a file or folder with the platform's default handler, without waiting for it."""
+    if _IS_WIN:
+        os.startfile(str(path))
+    else:
+        subprocess.Popen([_OPEN_COMMAND, str(path)], start_new_session=True,
+                         stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+class GenerationCancelled(Exception):
+    """Raised from a forward pre-hook once Stop is pressed, abandoning the batch in flight."""
+
+
+class AudioSink:
+    """Streams mono float32 chunks to a WAV file, or through an ffmpeg pipe to MP3.
+    
+    WAV files hold 16-bit PCM unless subtype='FLOAT' asks for 32-bit float samples.
+    """
+    def __init__(self, path, sample_rate=24000, mp3=False, mp3_quality=2, subtype='PCM_16'):
+        self.path = Path(path)
+        self.samples = 0
+        self.proc = None
+        self.file = None
+        self.clip = not mp3 and subtype == 'PCM_16'
+        if mp3:
+            # Raw float32 goes straight to libmp3lame at VBR -q:a mp3_quality; -threads 0 lets ffmpeg pick
+            self.proc = subprocess.Popen([
+                'ffmpeg', '-hide_banner', '-y', '-loglevel', 'error', '-f', 'f32le', '-ar', str(sample_rate),
+                '-ac', '1', '-i', 'pipe:0', '-c:a', 'libmp3lame', '-q:a', str(mp3_quality), '-threads', '0',
+                str(self.path)
+            ], stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+               bufsize=1 << 20)  # 1 MB pipe buffer: fewer, larger writes per batch
+        else:
+            self.file = sf.SoundFile(str(self.path), mode='w', samplerate=sample_rate,
+                                     channels=1, subtype=subtype)
+    
+    def write(self, chunk):
+        """Write one chunk; float32 contiguous input (the pinned host views) is never copied.
+        
+        For PCM_16 the chunk is clipped to [-1, 1] in place: libsndfile would wrap
+        overshoots around instead of clipping them.
+        """
+        chunk = np.ascontiguousarray(chunk, dtype=np.float32)
+        if self.clip:
+            np.clip(chunk, -1.0, 1.0, out=chunk)
+        if self.proc is not None:
+            self.proc.stdin.write(memoryview(chunk).cast('B'))
+        else:
+            self.file.write(chunk)
+        self.samples += len(chunk)
+    
+    def close(self):
+        """Finish the file; raises CalledProcessError if ffmpeg failed."""
+        if self.proc is not None:
+            _, err = self.proc.communicate()
+            if self.proc.returncode != 0:
+                raise subprocess.CalledProcessError(self.proc.returncode, 'ffmpeg', stderr=err)
+        else:
+            self.file.close()
+    
+    def abort(self):
+        """Stop writing and remove the partial file."""
+        if self.proc is not None:
+            self.proc.kill()
+            self.proc.communicate()
+        else:
+            self.file.close()
+        self.path.unlink(missing_ok=True)
+
+
+class ChunkReorderer:
+    """Writes waveforms to a sink in chunk order while batches arrive length-sorted."""
+    def __init__(self, sink):
+        self.sink = sink
+        self.written = 0  # Index of the next chunk the sink expects
+        self.held = {}  # Chunk index -> waveform that finished ahead of its turn
+    
+    def put(self, index, audio):
+        """Write audio now if it is next in line, otherwise hold a copy until it is."""
+        if index != self.written:
+            self.held[index] = audio.copy()  # audio can be a view of a reused pinned buffer
+            return
+        self.sink.write(audio)
+        self.written += 1
+        while self.written in self.held:
+            self.sink.write(self.held.pop(self.written))
+            self.written += 1
+
+
+class OnnxKokoro:
+    """Kokoro-82M exported to ONNX (onnx-community/Kokoro-82M-ONNX), run by ONNX Runtime.
+    
+    Takes the same phoneme strings and style packs as the PyTorch path, one chunk per run.
+    """
+    REPO_ID = "onnx-community/Kokoro-82M-ONNX"
+    MODEL_FILE = "onnx/model_q8f16.onnx"
+    
+    def __init__(self, device="cpu"):
+        import onnxruntime as ort
+        from huggingface_hub import hf_hub_download
+        self._download = hf_hub_download
+        # The export shares the PyTorch model's phoneme vocabulary
+        with open(hf_hub_download(KOKORO_REPO_ID, "config.json"), 'rb') as f:
+            self.vocab = json.load(f)['vocab']
+        available = ort.get_available_providers()
+        providers = ["CPUExecutionProvider"]
+        if device == "cuda" and "CUDAExecutionProvider" in available:
+            providers.insert(0, "CUDAExecutionProvider")
+        self.session = ort.InferenceSession(hf_hub_download(self.REPO_ID, self.MODEL_FILE),
+                                            providers=providers)
+        self.run_options = ort.RunOptions()  # terminate=True aborts the run in progress
+        # Feed every input in the dtype the graph declares (fp16 style in the f16 exports)
+        self.input_types = {i.name: np.float16 if i.type == 'tensor(float16)' else
+                            np.int64 if i.type == 'tensor(int64)' else np.float32
+                            for i in self.session.get_inputs()}
+        self.voices = {}
+    
+    def voice(self, name):
+        """Return the (N, 1, 256) style pack for a voice, read from disk only once.
+        
+        Packs are kept as fp16, half the memory of the fp32 files; synthesize() casts the
+        one row it uses to whatever the graph declares.
+        """
+        if name not in self.voices:
+            path = self._download(self.REPO_ID, f"voices/{name}.bin")
+            self.voices[name] = np.fromfile(path, dtype=np.float32).reshape(-1, 1, 256).astype(np.float16)
+        return self.voices[name]
+    
+    def synthesize(self, ps, pack, speed):
+        """Synthesize one phoneme string; returns float32 audio at 24 kHz."""
+        tokens = [0, *(self.vocab[p] for p in ps if p in self.vocab), 0]
+        inputs = {
+            "input_ids": np.array([tokens]),
+            "style": pack[len(ps) - 1],
+            "speed": np.array([speed]),
+        }
+        feed = {name: value.astype(self.input_types[name], copy=False) for name, value in inputs.items()}
+        audio = self.session.run(None, feed, self.run_options)[0]
+        return audio.reshape(-1).astype(np.float32, copy=False)
 
 
 class TextLineNumbers(tk.Canvas):
@@ -161,28 +345,66 @@ class TextLineNumbers(tk.Canvas):
     def __init__(self, parent, text_widget):
         super().__init__(parent, width=50, bg="#f0f0f0", highlightthickness=0)
         self.text_widget = text_widget
-        self.text_widget.bind("<KeyPress>", self.on_key_press)
-        self.text_widget.bind("<Button-1>", self.on_key_press)
-        self.text_widget.bind("<MouseWheel>", self.on_key_press)
+        self._redraw_pending = False
+        self._item = None  # Single multi-line canvas text item holding every number
+        self._drawn = []  # (line number, y) pairs currently shown
+        # Same font as the text so one canvas row matches one display line
+        self.font = tkfont.Font(font=self.text_widget.cget("font"))
+        self.text_widget.bind("<<Modified>>", self.on_modified, add="+")
+        self.text_widget.bind("<Configure>", self.schedule_redraw, add="+")
         self.update_line_numbers()
     
-    def on_key_press(self, event=None):
-        self.after_idle(self.update_line_numbers)
+    def on_modified(self, event=None):
+        """Turn Tk's one-shot <<Modified>> into a <<TextChanged>> event per edit."""
+        if not self.text_widget.edit_modified():
+            return  # Fired by the reset below
+        self.text_widget.edit_modified(False)
+        self.text_widget.event_generate("<<TextChanged>>")
+        self.schedule_redraw()
+    
+    def schedule_redraw(self, event=None):
+        """Coalesce redraw requests into one update when Tk is idle."""
+        if self._redraw_pending:
+            return
+        self._redraw_pending = True
+        self.after_idle(self._do_redraw)
+    
+    def _do_redraw(self):
+        self._redraw_pending = False
+        self.update_line_numbers()
     
     def update_line_numbers(self):
-        """Update the line numbers display."""
-        self.delete("all")
+        """Update the line numbers display with one multi-line canvas text item."""
+        drawn = []
         i = self.text_widget.index("@0,0")
         while True:
             dline = self.text_widget.dlineinfo(i)
             if dline is None:
                 break
-            y = dline[1]
-            linenum = str(i).split(".")[0]
-            self.create_text(2, y, anchor="nw", text=linenum, fill="#666", font=("Courier", 10))
+            drawn.append((str(i).split(".")[0], dline[1]))
             i = self.text_widget.index(f"{i}+1line")
             if i == self.text_widget.index("end"):
                 break
+        if drawn == self._drawn:
+            return
+        self._drawn = drawn
+        
+        # One row per display line: blank rows for the continuation lines of wrapped text
+        rows = []
+        linespace = self.font.metrics("linespace")
+        for n, (linenum, y) in enumerate(drawn):
+            rows.append(linenum)
+            if n + 1 < len(drawn):
+                rows.extend([""] * max(round((drawn[n + 1][1] - y) / linespace) - 1, 0))
+        text = "\n".join(rows)
+        first_y = drawn[0][1] if drawn else 0
+        x = int(self.cget("width")) - 4
+        if self._item is None:
+            self._item = self.create_text(x, first_y, anchor="ne", text=text, justify="right",
+                                          fill="#666", font=self.font)
+        else:
+            self.coords(self._item, x, first_y)
+            self.itemconfigure(self._item, text=text)
 
 
 class TextWithLineNumbers(tk.Frame):
@@ -191,61 +413,128 @@ class TextWithLineNumbers(tk.Frame):
         super().__init__(parent)
         self.text = tk.Text(self, *args, **kwargs)
         self.vsb = tk.Scrollbar(self, orient="vertical", command=self.text.yview)
-        self.text.configure(yscrollcommand=self.vsb.set)
+        self.text.configure(yscrollcommand=self.on_yscroll)
         self.linenumbers = TextLineNumbers(self, self.text)
         
         self.linenumbers.pack(side="left", fill="y")
         self.text.pack(side="left", fill="both", expand=True)
         self.vsb.pack(side="right", fill="y")
     
+    def on_yscroll(self, first, last):
+        """Scrollbar callback; fires on every view change, so it also drives the line numbers."""
+        self.vsb.set(first, last)
+        self.linenumbers.schedule_redraw()
+    
     def get(self, *args, **kwargs):
         return self.text.get(*args, **kwargs)
     
     def delete(self, *args, **kwargs):
-        result = self.text.delete(*args, **kwargs)
-        self.linenumbers.update_line_numbers()
-        return result
+        return self.text.delete(*args, **kwargs)
     
     def insert(self, *args, **kwargs):
-        result = self.text.insert(*args, **kwargs)
-        self.linenumbers.update_line_numbers()
-        return result
+        return self.text.insert(*args, **kwargs)
     
     def bind(self, *args, **kwargs):
         self.text.bind(*args, **kwargs)
 
 class KokoroTTSApp:
+    BATCH_SIZE = 8  # Chunks synthesized per forward pass
+    LOG_POLL_MS = 100  # Interval at which queued log messages reach the console panel
+    BUCKET_WINDOW = 4  # Batches' worth of chunks sorted by length together
+    WRITE_QUEUE = 4  # Staged batches waiting for the writer thread
+    PINNED_BUFFERS = 3  # One filling, one queued, one being written
+    MAX_PHONEMES = 510  # Kokoro context limit, same truncation as KPipeline
+    G2P_CACHE = 256  # Passages whose phonemes are kept between generations
+    SAMPLES_PER_FRAME = 600  # One predicted duration frame at 24kHz
+    COMPILED_MODULES = ("bert", "decoder")  # Heaviest KModel submodules
+    LEVEL_COLORS = {"DEBUG": "#888888", "INFO": "#00ff00", "WARNING": "#ffaa00",
+                    "ERROR": "#ff0000", "CRITICAL": "#ff00ff"}  # Others use the yellow default
+    WARMUP_PHONEMES = ("ə", "ə" * 200)  # Short and long inputs for the warm-up passes
+    BATCH_TOLERANCE = 0.05  # Relative L2 error allowed between a batched and an unbatched chunk
+    
     def __init__(self, root):
         self.root = root
         self.root.title("Kokoro-82M Text-to-Speech")
         self.root.geometry("900x800")
         
         # State
-        self.pipeline = None
-        if TORCH_AVAILABLE and torch.cuda.is_available():
-            self.device = "cuda"
-        elif TORCH_AVAILABLE and torch.backends.mps.is_available():
-            self.device = "mps"
-        else:
-            self.device = "cpu"
+        self.pipelines = {}  # Language code -> model-less KPipeline (G2P only)
+        self.model = None  # The one KModel, loaded on the first PyTorch generation or warm-up
+        self.model_dtype = None  # Set when the model is loaded
+        self.onnx = None  # OnnxKokoro, loaded on first use of the ONNX backend
+        self.pipeline_lock = threading.Lock()  # Warm-up and generation share the pipelines and model
+        self._voice_cache = {}  # Voice name -> style pack on self.device
+        self._phonemize = functools.lru_cache(maxsize=self.G2P_CACHE)(self.phonemize)  # (lang, passage) -> chunks
+        self._eager_modules = {}  # Originals of submodules wrapped by torch.compile
+        self.batch_verified = None  # Set by check_batch_parity(); batching stays off unless True
+        # Set by init_torch() once the background import finishes
+        self.torch_ready = False
+        self._warmup_done = threading.Event()  # Set once the start-up warm-up has finished or failed
+        self.backend_error = None  # ImportError message if torch/kokoro are missing
+        self.device = "cpu"
+        self.copy_stream = None
+        self._pinned_free = queue.Queue()  # Pinned host staging buffers not held by the writer
+        for _ in range(self.PINNED_BUFFERS):
+            self._pinned_free.put(None)  # Allocated on first use
+        self.infer_streams = [None]
+        self.infer_pool = None
+        self.cpu_bf16 = False  # BF16 autocast on CPUs with native BF16 support
         
         self.is_processing = False
+        self._cancel = threading.Event()  # Set by Stop; checked between chunks and inside forward passes
+        self._cancel_hooks = []  # Forward pre-hook handles on the model
         self.output_format = tk.StringVar(value="wav")
+        self.mp3_preset = tk.StringVar(value="Quality")  # Key of MP3_PRESETS
         self.selected_voice = tk.StringVar(value=KOKORO_VOICES[0])
         self.speed = tk.DoubleVar(value=1.0)
+        self.torch_compile = tk.BooleanVar(value=True)  # Read once at start-up
+        self.backend = tk.StringVar(value="torch")  # One of BACKENDS
+        self.batch_inference = tk.BooleanVar(value=True)  # Padded, length-bucketed batches
         
         # Console visibility and filtering
         self.console_visible = tk.BooleanVar(value=False)  # Hidden by default
         self.log_level_filter = tk.StringVar(value="INFO")
-        self.log_messages = []  # Store all log messages for filtering
+        self.log_messages = deque(maxlen=5000)  # Most recent log messages, mirrored in log_text
+        self._log_queue = queue.SimpleQueue()  # Messages from any thread, drained by _poll_log
+        self._log_pending = []  # Messages not yet inserted into log_text
+        self._log_shown = deque()  # Line count of each entry in log_text, oldest first
+        self._log_lines = 0  # Total lines in log_text, so inserts need no index() probes
         
         # Settings file path
         self.settings_file = Path(__file__).parent / "kokoro-settings.json"
+        self.text_file = Path(__file__).parent / "kokoro-text.txt"  # Text input, kept out of the JSON
         self.save_timer = None  # For debounced saving
+        self.text_save_timer = None  # For debounced text saving
+        self.saved_text = None  # Text currently in kokoro-text.txt
+        self.settings_hash = None  # Hash of the last saved settings
+        self.settings_lock = threading.Lock()  # Serializes background settings writes
+        self.settings_version = 0  # Bumped per save request
+        self.settings_written = 0  # Version currently on disk
+        self.stats_timer = None  # For debounced text statistics
+        self._text_version = 0  # Bumped on every <<TextChanged>>
+        self._last_stats_version = None  # Text version the stats label shows
         self.loading_settings = False  # Flag to prevent saves during loading
         
-        # Check FFmpeg before setting up UI
-        self.has_ffmpeg = shutil.which("ffmpeg") is not None
+        # Unknown until _probe_env reports back; MP3 stays disabled until then
+        self.has_ffmpeg = None
+        
+        # Terminal mirror of the log: one buffered UTF-8 writer, flushed by _poll_log
+        self._log_buffer = []
+        stdout_buffer = getattr(sys.stdout, 'buffer', None)
+        if stdout_buffer is not None:
+            self._stdout = io.TextIOWrapper(stdout_buffer, encoding='utf-8', errors='replace',
+                                            line_buffering=False, write_through=False)
+        else:
+            self._stdout = sys.stdout  # StringIO in the frozen windowed build, None under pythonw
+        
+        # Capture Kokoro's own loguru output in the console panel too; the mirror above
+        # replaces loguru's default stderr handler
+        if loguru_logger is not None:
+            try:
+                loguru_logger.remove(0)
+            except ValueError:
+                pass
+            loguru_logger.add(self._loguru_sink, level="DEBUG", format="{message}")
         
         # Setup UI first (so log_text exists)
         self.setup_ui()
@@ -253,13 +542,16 @@ class KokoroTTSApp:
         # Load saved settings
         self.load_settings()
         
-        # Check CUDA availability (after UI is set up)
-        self.check_cuda()
+        # Start moving queued log messages into the console panel
+        self._poll_log()
         
-        # Log FFmpeg status
-        if not self.has_ffmpeg:
-            self.output_format.set("wav")  # Force WAV if no FFmpeg
-            self.log("FFmpeg not found - MP3 output disabled. WAV format will be used.", level="WARNING")
+        # Look for FFmpeg once the window is up
+        self.root.after(0, self._probe_env)
+        
+        # Import torch/kokoro, load the model and warm the default voice without blocking the window
+        self.compile_enabled = self.torch_compile.get()
+        threading.Thread(target=self._bg_import, args=(self.selected_voice.get(), self.backend.get()),
+                         daemon=True).start()
     
     def create_tooltip(self, widget, text):
         """Create a tooltip for a widget."""
@@ -281,25 +573,120 @@ class KokoroTTSApp:
         widget.bind("<Enter>", on_enter)
         widget.bind("<Leave>", on_leave)
     
+    def _probe_env(self):
+        """Search PATH for FFmpeg on a worker thread; the walk is slow on Windows."""
+        def probe():
+            has_ffmpeg = shutil.which("ffmpeg") is not None
+            self.root.after(0, self._apply_env, has_ffmpeg)
+        threading.Thread(target=probe, daemon=True).start()
+    
+    def _apply_env(self, has_ffmpeg):
+        """Back on the Tk thread: enable MP3 output or fall back to WAV."""
+        self.has_ffmpeg = has_ffmpeg
+        if has_ffmpeg:
+            self.mp3_radio.config(state="normal")
+            self.mp3_combo.config(state="readonly")
+        else:
+            if self.output_format.get() == "mp3":
+                self.output_format.set("wav")  # Force WAV if no FFmpeg
+            self.log("FFmpeg not found - MP3 output disabled. WAV format will be used.", level="WARNING")
+    
+    def _bg_import(self, voice, backend):
+        """Background start-up: import the backends, pick the device and warm the model.
+        
+        Play is enabled before the warm-up; a generation started meanwhile waits on
+        pipeline_lock and then reuses the pipeline and voice the warm-up loaded.
+        """
+        try:
+            import_backends()
+        except ImportError as e:
+            self.backend_error = str(e)
+            self.log(f"Kokoro not available: {e}", level="ERROR")
+            self.root.after(0, self._on_import_failed)
+            return
+        self.init_torch()
+        self.check_cuda()
+        self.root.after(0, self._on_ready)
+        try:
+            self.warm_up(voice, backend)
+        finally:
+            self._warmup_done.set()
+    
+    def init_torch(self):
+        """Pick the device and set up the CUDA state once torch is imported."""
+        if torch.cuda.is_available():
+            self.device = "cuda"
+        elif torch.backends.mps.is_available():
+            self.device = "mps"
+        else:
+            self.device = "cpu"
+        
+        # Inference only: let cuDNN pick the fastest kernels and allow TF32 matmuls
+        torch.backends.cudnn.benchmark = True
+        torch.backends.cuda.matmul.allow_tf32 = True
+        torch.backends.cudnn.allow_tf32 = True
+        
+        # GPUs run in half precision via half_precision(); CPUs with AVX512-BF16/AMX use autocast
+        if self.device == "cpu":
+            try:
+                self.cpu_bf16 = (torch.backends.mkldnn.is_available()
+                                 and torch.ops.mkldnn._is_mkldnn_bf16_supported())
+            except (AttributeError, RuntimeError):
+                self.cpu_bf16 = False
+            if self.cpu_bf16:
+                self.log("CPU supports BF16 - using bfloat16 autocast", level="INFO")
+        
+        self.copy_stream = torch.cuda.Stream() if self.device == "cuda" else None
+        # Two batches in flight on alternating CUDA streams; on CPU a second thread would only oversubscribe.
+        # torch.compile'd submodules get a single thread and stream: two threads running the same
+        # compiled module race on Dynamo's guards and recompiles, and with CUDA graphs each thread
+        # would replay into the same static outputs without any ordering between them
+        if self.device == "cuda" and not self.compile_enabled:
+            self.infer_streams = [torch.cuda.Stream(), torch.cuda.Stream()]
+        else:
+            self.infer_streams = [torch.cuda.Stream() if self.device == "cuda" else None]
+        self.infer_pool = ThreadPoolExecutor(max_workers=len(self.infer_streams))
+        self.torch_ready = True
+    
+    def _on_ready(self):
+        """Back on the Tk thread: show the device and enable Play."""
+        self.device_label.config(text=self.device.upper())
+        self.log(f"Device: {self.device.upper()}", level="INFO")
+        if not self.is_processing:
+            self.generate_button.config(state="normal")
+        self.log("Ready. Enter text and click Play to generate speech.", level="INFO")
+    
+    def _on_import_failed(self):
+        messagebox.showerror(
+            "Missing Dependency",
+            "Kokoro package is not installed.\n\n"
+            "Please install it with:\n"
+            "pip install kokoro numpy soundfile"
+        )
+        self.root.destroy()
+    
     def check_cuda(self):
         """Check CUDA availability and log GPU info."""
-        if TORCH_AVAILABLE and torch.cuda.is_available():
+        if torch.cuda.is_available():
             gpu_name = torch.cuda.get_device_name(0)
             self.log(f"CUDA available - GPU: {gpu_name}", level="INFO")
             self.log(f"CUDA version: {torch.version.cuda}", level="INFO")
+            # Leave headroom for the display and other apps sharing the GPU
+            torch.cuda.set_per_process_memory_fraction(0.85, 0)
         else:
             self.log("CUDA not available - using CPU (slower)", level="WARNING")
     
     def load_settings(self):
-        """Load settings from kokoro-settings.json."""
+        """Load settings from kokoro-settings.json and the text from kokoro-text.txt."""
+        self.load_text_input()
         if not self.settings_file.exists():
             self.loading_settings = False
             return
         
         self.loading_settings = True
         try:
-            with open(self.settings_file, 'r', encoding='utf-8') as f:
-                settings = json.load(f)
+            data = self.settings_file.read_bytes()
+            settings = orjson.loads(data) if orjson else json.loads(data)
             
             # Load voice
             if 'voice' in settings and settings['voice'] in KOKORO_VOICES:
@@ -315,11 +702,11 @@ class KokoroTTSApp:
                     pass
             
             # Load output format
-            if 'output_format' in settings and settings['output_format'] in ['wav', 'mp3']:
-                if settings['output_format'] == 'mp3' and not self.has_ffmpeg:
-                    self.output_format.set('wav')
-                else:
-                    self.output_format.set(settings['output_format'])
+            if 'output_format' in settings and settings['output_format'] in ['wav', 'wav32', 'mp3']:
+                # MP3 is reverted to WAV by _apply_env if FFmpeg turns out to be missing
+                self.output_format.set(settings['output_format'])
+            if settings.get('mp3_preset') in MP3_PRESETS:
+                self.mp3_preset.set(settings['mp3_preset'])
             
             # Load output path
             if 'output_path' in settings:
@@ -327,11 +714,19 @@ class KokoroTTSApp:
                 if path.exists() or path.parent.exists():
                     self.output_path.set(str(path))
             
-            # Load text input
-            if 'text_input' in settings:
+            # Text input from older settings files; migrate it to kokoro-text.txt
+            if 'text_input' in settings and self.saved_text is None:
                 self.text_input.delete(1.0, tk.END)
                 self.text_input.insert(1.0, settings['text_input'])
-                self.update_text_stats()
+                self.save_text_input()
+            
+            # Load torch.compile flag and inference backend
+            if 'torch_compile' in settings:
+                self.torch_compile.set(bool(settings['torch_compile']))
+            if settings.get('backend') in BACKENDS:
+                self.backend.set(settings['backend'])
+            if 'batch_inference' in settings:
+                self.batch_inference.set(bool(settings['batch_inference']))
             
             # Load console visibility
             if 'console_visible' in settings:
@@ -356,17 +751,82 @@ class KokoroTTSApp:
                 'voice': self.selected_voice.get(),
                 'speed': self.speed.get(),
                 'output_format': self.output_format.get(),
+                'mp3_preset': self.mp3_preset.get(),
                 'output_path': self.output_path.get(),
-                'text_input': self.text_input.text.get(1.0, tk.END).strip(),
                 'console_visible': self.console_visible.get(),
-                'log_level_filter': self.log_level_filter.get()
+                'log_level_filter': self.log_level_filter.get(),
+                'torch_compile': self.torch_compile.get(),
+                'backend': self.backend.get(),
+                'batch_inference': self.batch_inference.get()
             }
             
-            with open(self.settings_file, 'w', encoding='utf-8') as f:
-                json.dump(settings, f, indent=2, ensure_ascii=False)
+            # Nothing changed since the last save (e.g. cursor moves, modifier keys)
+            settings_hash = hash(tuple(sorted(settings.items())))
+            if settings_hash == self.settings_hash:
+                return
+            self.settings_hash = settings_hash
+            self.settings_version += 1
+            
+            # Serialize and write off the Tk thread
+            threading.Thread(target=self.write_settings, args=(settings, self.settings_version),
+                             daemon=True).start()
         except Exception as e:
             self.log(f"Error saving settings: {e}", level="ERROR")
     
+    def write_settings(self, settings, version):
+        """Write settings atomically: a temp file replaced over kokoro-settings.json.
+        
+        A writer that loses the race to a newer version skips its stale write.
+        """
+        try:
+            if orjson:
+                data = orjson.dumps(settings, option=orjson.OPT_INDENT_2)
+            else:
+                data = json.dumps(settings, indent=2, ensure_ascii=False).encode('utf-8')
+            with self.settings_lock:
+                if version < self.settings_written:
+                    return
+                self.settings_written = version
+                temp_file = self.settings_file.with_suffix('.tmp')
+                temp_file.write_bytes(data)
+                os.replace(temp_file, self.settings_file)
+        except Exception as e:
+            self.log(f"Error saving settings: {e}", level="ERROR")
+    
+    def load_text_input(self):
+        """Restore the text input from kokoro-text.txt."""
+        if not self.text_file.exists():
+            return
+        try:
+            text = self.text_file.read_bytes().decode('utf-8')
+            self.text_input.delete(1.0, tk.END)
+            self.text_input.insert(1.0, text)
+            self.saved_text = text
+        except Exception as e:
+            self.log(f"Error loading text: {e}", level="WARNING")
+    
+    def save_text_input(self):
+        """Write the text input to kokoro-text.txt as raw UTF-8, atomically."""
+        self.text_save_timer = None
+        try:
+            text = self.text_input.text.get(1.0, tk.END).strip()
+            if text == self.saved_text:
+                return
+            temp_file = self.text_file.with_suffix('.tmp')
+            temp_file.write_bytes(text.encode('utf-8'))
+            os.replace(temp_file, self.text_file)
+            self.saved_text = text
+        except Exception as e:
+            self.log(f"Error saving text: {e}", level="ERROR")
+    
+    def debounced_text_save(self):
+        """Schedule a text save after 400ms delay (debounced), separately from settings."""
+        if self.loading_settings:
+            return
+        if self.text_save_timer is not None:
+            self.root.after_cancel(self.text_save_timer)
+        self.text_save_timer = self.root.after(400, self.save_text_input)
+    
     def debounced_save(self):
         """Schedule a save after 400ms delay (debounced)."""
         # Don't save if we're currently loading settings
@@ -388,24 +848,35 @@ class KokoroTTSApp:
         bytes_count = len(text.encode('utf-8'))
         
         # Words (split by whitespace)
-        words = text.split()
-        words_count = len(words)
+        words_count = len(text.split())
         
-        # Sentences (split by . ! ?)
-        sentences = re.split(r'[.!?]+', text)
-        sentences_count = len([s for s in sentences if s.strip()])
+        # Sentences (runs of text between . ! ?)
+        sentences_count = sum(1 for _ in _SENT_RE.finditer(text))
         
         # Lines
-        lines_count = len(text.split('\n'))
+        lines_count = text.count('\n') + 1
         
         # Tokens (simple approximation: words + punctuation)
-        tokens = re.findall(r'\b\w+\b|[^\w\s]', text)
-        tokens_count = len(tokens)
+        tokens_count = sum(1 for _ in _TOK_RE.finditer(text))
         
         return bytes_count, words_count, sentences_count, lines_count, tokens_count
     
+    def on_text_changed(self, event=None):
+        self._text_version += 1
+        self.schedule_text_stats()
+    
+    def schedule_text_stats(self):
+        """Recompute the text statistics 150ms after the last keystroke (debounced)."""
+        if self.stats_timer is not None:
+            self.root.after_cancel(self.stats_timer)
+        self.stats_timer = self.root.after(150, self.update_text_stats)
+    
     def update_text_stats(self):
         """Update the text statistics display."""
+        self.stats_timer = None
+        if self._text_version == self._last_stats_version:
+            return
+        self._last_stats_version = self._text_version
         bytes_count, words_count, sentences_count, lines_count, tokens_count = self.calculate_text_stats()
         stats_text = f"Bytes: {bytes_count} | Words: {words_count} | Sentence: {sentences_count} | Line: {lines_count} | Tokens: {tokens_count}"
         self.stats_label.config(text=stats_text)
@@ -425,8 +896,28 @@ class KokoroTTSApp:
         
         # Device label
         ttk.Label(row1, text="Device:").pack(side="left", padx=5)
-        self.device_label = ttk.Label(row1, text=self.device.upper(), font=("Arial", 9, "bold"))
-        self.device_label.pack(side="left", padx=(0, 15))
+        self.device_label = ttk.Label(row1, text="...", font=("Arial", 9, "bold"))
+        self.device_label.pack(side="left", padx=(0, 5))
+        compile_check = ttk.Checkbutton(row1, text="Compile", variable=self.torch_compile,
+                                        command=self.debounced_save)
+        compile_check.pack(side="left", padx=(0, 15))
+        self.create_tooltip(compile_check, "torch.compile the model on CUDA: slower start-up, faster "
+                                           "generation. Takes effect on next start.")
+        
+        # Backend dropdown
+        ttk.Label(row1, text="Backend:").pack(side="left", padx=5)
+        backend_combo = ttk.Combobox(row1, textvariable=self.backend,
+                                     values=BACKENDS, state="readonly", width=6)
+        backend_combo.pack(side="left", padx=5)
+        backend_combo.bind("<<ComboboxSelected>>", lambda e: self.debounced_save())
+        self.create_tooltip(backend_combo, "torch: PyTorch KModel with batching. onnx: quantized ONNX "
+                                           "export (q8f16) through ONNX Runtime; needs onnxruntime.")
+        batch_check = ttk.Checkbutton(row1, text="Batch", variable=self.batch_inference,
+                                      command=self.debounced_save)
+        batch_check.pack(side="left", padx=(0, 15))
+        self.create_tooltip(batch_check, f"torch backend: synthesize up to {self.BATCH_SIZE} segments of "
+                                         "similar length per padded forward pass. Only used once a "
+                                         "batched test segment matches the same segment synthesized alone.")
         
         # Voice dropdown
         ttk.Label(row1, text="Voice:").pack(side="left", padx=5)
@@ -452,12 +943,20 @@ class KokoroTTSApp:
         ttk.Label(row2, text="Output Format:").pack(side="left", padx=5)
         ttk.Radiobutton(row2, text="WAV", variable=self.output_format, 
                        value="wav").pack(side="left", padx=5)
-        mp3_radio = ttk.Radiobutton(row2, text="MP3", variable=self.output_format, 
-                                   value="mp3")
-        mp3_radio.pack(side="left", padx=5)
-        if not self.has_ffmpeg:
-            mp3_radio.config(state="disabled")
+        wav32_radio = ttk.Radiobutton(row2, text="WAV 32-bit", variable=self.output_format,
+                                      value="wav32")
+        wav32_radio.pack(side="left", padx=5)
+        self.create_tooltip(wav32_radio, "32-bit float WAV: no 16-bit rounding, twice the file size")
+        self.mp3_radio = ttk.Radiobutton(row2, text="MP3", variable=self.output_format, 
+                                        value="mp3", state="disabled")  # Enabled by _apply_env
+        self.mp3_radio.pack(side="left", padx=5)
         self.output_format.trace('w', lambda *args: self.debounced_save())
+        self.mp3_combo = ttk.Combobox(row2, textvariable=self.mp3_preset, values=list(MP3_PRESETS),
+                                      state="disabled", width=8)  # Enabled by _apply_env
+        self.mp3_combo.pack(side="left", padx=5)
+        self.mp3_combo.bind("<<ComboboxSelected>>", lambda e: self.debounced_save())
+        self.create_tooltip(self.mp3_combo, "MP3 encoding: Fast (VBR -q:a 6, smaller, quicker) or "
+                                            "Quality (VBR -q:a 2)")
         
         # Output path
         ttk.Label(row2, text="Output Save to:").pack(side="left", padx=(20, 5))
@@ -476,7 +975,8 @@ class KokoroTTSApp:
         play_icon = "▶"  # Unicode play symbol
         self.generate_button = tk.Button(row3, text=play_icon, font=("Arial", 16), 
                                          command=self.start_generation, 
-                                         width=3, height=1, relief="raised")
+                                         width=3, height=1, relief="raised",
+                                         state="disabled")  # Enabled once the model is ready
         self.generate_button.pack(side="left", padx=5)
         self.create_tooltip(self.generate_button, "Generate speech from the text input")
         
@@ -494,7 +994,7 @@ class KokoroTTSApp:
         
         # Clear button
         ttk.Button(row3, text="Clear", 
-                  command=lambda: [self.text_input.delete(1.0, tk.END), self.update_text_stats(), self.debounced_save()]).pack(side="left", padx=5)
+                  command=lambda: [self.text_input.delete(1.0, tk.END), self.debounced_text_save()]).pack(side="left", padx=5)
         
         # ========== INPUT TEXT-TO-SPEECH SECTION ==========
         self.text_frame = ttk.LabelFrame(main_frame, text="Input Text-to-Speech", padding="5")
@@ -508,8 +1008,9 @@ class KokoroTTSApp:
         self.text_input.pack(fill="both", expand=True)
         
         # Bind text changes to update statistics and save settings
-        self.text_input.text.bind("<KeyRelease>", lambda e: [self.update_text_stats(), self.debounced_save()])
-        self.text_input.text.bind("<Button-1>", lambda e: self.update_text_stats())
+        # <<TextChanged>> fires once per real edit (typed or programmatic); clicks don't change content
+        self.text_input.text.bind("<<TextChanged>>", self.on_text_changed, add="+")
+        self.text_input.text.bind("<KeyRelease>", lambda e: self.debounced_text_save())
         
         # Text statistics bar
         stats_frame = ttk.Frame(self.text_frame)
@@ -546,12 +1047,14 @@ class KokoroTTSApp:
                                                    font=("Consolas", 9))
         # Don't pack initially - toggle_console will handle it
         
+        # One tag per level; filtering only toggles elide on these tags
+        for level, color in self.LEVEL_COLORS.items():
+            self.log_text.tag_config(f"level_{level}", foreground=color)
+        self.filter_logs()
+        
         # Initial log
         self.log("Kokoro-82M Text-to-Speech Application", level="INFO")
-        self.log(f"Device: {self.device.upper()}", level="INFO")
-        if self.device == "cuda" and TORCH_AVAILABLE:
-            self.log(f"GPU: {torch.cuda.get_device_name(0)}", level="INFO")
-        self.log("Ready. Enter text and click Play to generate speech.", level="INFO")
+        self.log("Loading PyTorch and Kokoro in the background...", level="INFO")
         
         # Initialize text statistics
         self.update_text_stats()
@@ -561,19 +1064,45 @@ class KokoroTTSApp:
     
     def log(self, message, level="INFO"):
         """Add message to log with level filtering."""
-        # Store message with level
-        log_entry = {"message": message, "level": level}
-        self.log_messages.append(log_entry)
-        
-        # Apply filter
-        self.filter_logs()
-        
-        # Print to console with safe encoding
+        if loguru_logger is not None:
+            # The sink below adds it to the console panel and the terminal mirror
+            loguru_logger.log(level, message)
+        else:
+            self.append_log(message, level)
+    
+    def _loguru_sink(self, message):
+        record = message.record
+        self.append_log(record["message"], record["level"].name)
+    
+    def append_log(self, message, level):
+        """Queue a message for the console panel; safe to call from any thread."""
+        self._log_queue.put({"message": message, "level": level})
+    
+    def _poll_log(self):
+        """Every LOG_POLL_MS on the Tk thread: move queued messages into the panel and terminal."""
         try:
-            print(f"[{level}] {message}")
-        except UnicodeEncodeError:
-            safe_message = f"[{level}] {message}".encode('ascii', 'replace').decode('ascii')
-            print(safe_message)
+            while True:
+                log_entry = self._log_queue.get_nowait()
+                self.log_messages.append(log_entry)
+                self._log_pending.append(log_entry)
+                # errors='replace' on the terminal writer covers what used to need the ASCII retry
+                self._log_buffer.append(self.format_log_line(log_entry))
+        except queue.Empty:
+            pass
+        self.flush_log()
+        self._flush_stdout()
+        self.root.after(self.LOG_POLL_MS, self._poll_log)
+    
+    def _flush_stdout(self):
+        """Write the buffered log lines to the terminal in one call."""
+        lines, self._log_buffer = self._log_buffer, []
+        if self._stdout is None or not lines:
+            return
+        try:
+            self._stdout.write("".join(lines))
+            self._stdout.flush()
+        except (OSError, ValueError):
+            pass
     
     def toggle_console(self):
         """Toggle console visibility and adjust text area size."""
@@ -591,55 +1120,53 @@ class KokoroTTSApp:
             # Maximize text_frame expansion
             self.text_frame.pack(fill="both", expand=True, pady=(0, 10))
     
-    def filter_logs(self):
-        """Filter and display logs based on selected level."""
-        selected_level = self.log_level_filter.get()
+    @staticmethod
+    def format_log_line(entry):
+        return f"[{entry['level']}] {entry['message']}\n"
+    
+    def flush_log(self):
+        """Insert pending log lines with one insert and one tag_add per level."""
+        entries, self._log_pending = self._log_pending, []
+        if not entries:
+            return
         
-        # Map log levels to numeric values for comparison
-        level_order = {"DEBUG": 0, "INFO": 1, "WARNING": 2, "ERROR": 3, "CRITICAL": 4}
+        # Line ranges are computed from a running counter rather than widget index() calls
+        ranges = {}
+        line = self._log_lines + 1
+        for entry in entries:
+            count = entry["message"].count("\n") + 1
+            ranges.setdefault(f"level_{entry['level']}", []).extend((f"{line}.0", f"{line + count}.0"))
+            self._log_shown.append(count)
+            line += count
+        self._log_lines = line - 1
         
         self.log_text.config(state="normal")
-        self.log_text.delete(1.0, tk.END)
-        
-        # Filter and display messages
-        for entry in self.log_messages:
-            entry_level = entry["level"]
-            
-            if selected_level == "ALL":
-                should_show = True
-            elif selected_level in level_order and entry_level in level_order:
-                # Show messages at or above the selected level
-                should_show = level_order[entry_level] >= level_order[selected_level]
-            else:
-                should_show = True
-            
-            if should_show:
-                # Color code by level
-                color = "#ffff00"  # Default yellow
-                tag_name = f"level_{entry_level}"
-                if entry_level == "DEBUG":
-                    color = "#888888"  # Gray
-                elif entry_level == "INFO":
-                    color = "#00ff00"  # Green
-                elif entry_level == "WARNING":
-                    color = "#ffaa00"  # Orange
-                elif entry_level == "ERROR":
-                    color = "#ff0000"  # Red
-                elif entry_level == "CRITICAL":
-                    color = "#ff00ff"  # Magenta
-                
-                # Insert message and tag it
-                start_pos = self.log_text.index(tk.END)
-                self.log_text.insert(tk.END, f"[{entry_level}] {entry['message']}\n")
-                end_pos = self.log_text.index(tk.END + "-1c")
-                
-                # Apply color tag
-                self.log_text.tag_add(tag_name, start_pos, end_pos)
-                self.log_text.tag_config(tag_name, foreground=color)
+        self.log_text.insert(tk.END, "".join(self.format_log_line(entry) for entry in entries))
+        for tag, indices in ranges.items():
+            self.log_text.tag_add(tag, *indices)
+        
+        # Drop the oldest lines past the deque's limit, in a single delete
+        trimmed = 0
+        while len(self._log_shown) > self.log_messages.maxlen:
+            trimmed += self._log_shown.popleft()
+        if trimmed:
+            self.log_text.delete("1.0", f"{trimmed + 1}.0")
+            self._log_lines -= trimmed
         
         self.log_text.see(tk.END)
         self.log_text.config(state="disabled")
     
+    def filter_logs(self):
+        """Show only logs at or above the selected level by eliding the other level tags."""
+        selected_level = self.log_level_filter.get()
+        
+        # "ALL" and unknown levels hide nothing
+        min_order = LEVEL_ORDER.get(selected_level, 0)
+        for level, order in LEVEL_ORDER.items():
+            self.log_text.tag_config(f"level_{level}", elide=order < min_order)
+        
+        self.log_text.see(tk.END)
+    
     def load_text_file(self):
         """Load text from a file."""
         filepath = filedialog.askopenfilename(
@@ -652,8 +1179,7 @@ class KokoroTTSApp:
                     content = f.read()
                 self.text_input.delete(1.0, tk.END)
                 self.text_input.insert(1.0, content)
-                self.update_text_stats()
-                self.debounced_save()
+                self.debounced_text_save()
                 self.log(f"Loaded text from: {os.path.basename(filepath)}", level="INFO")
             except Exception as e:
                 messagebox.showerror("Error", f"Failed to load file: {e}")
@@ -679,12 +1205,7 @@ class KokoroTTSApp:
                 return
         
         try:
-            if sys.platform.startswith('win'):
-                os.startfile(str(folder_path))
-            elif sys.platform.startswith('darwin'):
-                subprocess.run(['open', str(folder_path)])
-            else:
-                subprocess.run(['xdg-open', str(folder_path)])
+            open_in_system(folder_path)
             self.log(f"Opened folder: {folder_path}", level="INFO")
         except Exception as e:
             messagebox.showerror("Error", f"Failed to open folder: {e}")
@@ -705,41 +1226,28 @@ class KokoroTTSApp:
         y = (dialog.winfo_screenheight() // 2) - (dialog.winfo_height() // 2)
         dialog.geometry(f"+{x}+{y}")
         
-        # Main frame
+        # One grid: icon beside four message rows, buttons along the bottom
         main_frame = ttk.Frame(dialog, padding="20")
         main_frame.pack(fill="both", expand=True)
-        
-        # Success icon and message
-        info_frame = ttk.Frame(main_frame)
-        info_frame.pack(fill="x", pady=(0, 15))
+        main_frame.grid_columnconfigure(1, weight=1)
         
         # Icon (using a simple label with text)
-        icon_label = ttk.Label(info_frame, text="✓", font=("Arial", 24), foreground="green")
-        icon_label.pack(side="left", padx=(0, 15))
+        ttk.Label(main_frame, text="✓", font=("Arial", 24), foreground="green").grid(
+            row=0, column=0, rowspan=4, sticky="n", padx=(0, 15))
         
         # Message
-        msg_frame = ttk.Frame(info_frame)
-        msg_frame.pack(side="left", fill="both", expand=True)
-        
-        ttk.Label(msg_frame, text="Audio generated successfully!", 
-                 font=("Arial", 11, "bold")).pack(anchor="w")
-        ttk.Label(msg_frame, text=f"File: {output_file.name}").pack(anchor="w", pady=(5, 0))
-        ttk.Label(msg_frame, text=f"Location: {output_dir}").pack(anchor="w")
-        ttk.Label(msg_frame, text=f"Duration: {duration:.2f} seconds").pack(anchor="w")
-        
-        # Button frame
-        button_frame = ttk.Frame(main_frame)
-        button_frame.pack(fill="x", pady=(10, 0))
+        ttk.Label(main_frame, text="Audio generated successfully!", 
+                 font=("Arial", 11, "bold")).grid(row=0, column=1, columnspan=2, sticky="w")
+        ttk.Label(main_frame, text=f"File: {output_file.name}").grid(
+            row=1, column=1, columnspan=2, sticky="w", pady=(5, 0))
+        ttk.Label(main_frame, text=f"Location: {output_dir}").grid(row=2, column=1, columnspan=2, sticky="w")
+        ttk.Label(main_frame, text=f"Duration: {duration:.2f} seconds").grid(
+            row=3, column=1, columnspan=2, sticky="w", pady=(0, 15))
         
         def open_file():
             """Open the file with default system player."""
             try:
-                if sys.platform.startswith('win'):
-                    os.startfile(str(output_file))
-                elif sys.platform.startswith('darwin'):
-                    subprocess.run(['open', str(output_file)])
-                else:
-                    subprocess.run(['xdg-open', str(output_file)])
+                open_in_system(output_file)
                 dialog.destroy()
             except Exception as e:
                 messagebox.showerror("Error", f"Failed to open file: {e}")
@@ -747,20 +1255,18 @@ class KokoroTTSApp:
         def open_folder():
             """Open the folder containing the file."""
             try:
-                if sys.platform.startswith('win'):
-                    os.startfile(str(output_dir))
-                elif sys.platform.startswith('darwin'):
-                    subprocess.run(['open', str(output_dir)])
-                else:
-                    subprocess.run(['xdg-open', str(output_dir)])
+                open_in_system(output_dir)
                 dialog.destroy()
             except Exception as e:
                 messagebox.showerror("Error", f"Failed to open folder: {e}")
         
         # Buttons
-        ttk.Button(button_frame, text="Open", command=open_file, width=12).pack(side="left", padx=5)
-        ttk.Button(button_frame, text="To Folder", command=open_folder, width=12).pack(side="left", padx=5)
-        ttk.Button(button_frame, text="OK", command=dialog.destroy, width=12).pack(side="right", padx=5)
+        ttk.Button(main_frame, text="Open", command=open_file, width=12).grid(
+            row=4, column=0, sticky="w", padx=5, pady=(10, 0))
+        ttk.Button(main_frame, text="To Folder", command=open_folder, width=12).grid(
+            row=4, column=1, sticky="w", padx=5, pady=(10, 0))
+        ttk.Button(main_frame, text="OK", command=dialog.destroy, width=12).grid(
+            row=4, column=2, sticky="e", padx=5, pady=(10, 0))
     
     def start_generation(self):
         """Start text-to-speech generation in a separate thread."""
@@ -775,90 +1281,509 @@ class KokoroTTSApp:
             return
         
         # Check Kokoro availability
-        if not KOKORO_AVAILABLE:
+        if self.backend_error is not None:
             messagebox.showerror("Error", "Kokoro package not available. Please install it.")
             return
+        if not self.torch_ready:
+            messagebox.showwarning("Warning", "The model is still loading. Please wait a moment.")
+            return
+        if not self._warmup_done.wait(timeout=0):
+            self.log("Model warm-up still running; generation will start as soon as it finishes", level="INFO")
         
         # Disable controls
         self.is_processing = True
+        self._cancel.clear()
         self.generate_button.config(state="disabled")
         self.stop_button.config(state="normal")
         
+        # Read every Tk variable here on the Tk thread; the worker only sees plain values
+        options = {
+            'voice': self.selected_voice.get(),
+            'speed': self.speed.get(),
+            'backend': self.backend.get(),
+            'batch_size': self.BATCH_SIZE if self.batch_inference.get() else 1,
+            'mp3': self.output_format.get() == "mp3" and bool(self.has_ffmpeg),
+            'wav_subtype': 'FLOAT' if self.output_format.get() == "wav32" else 'PCM_16',
+            'mp3_quality': MP3_PRESETS[self.mp3_preset.get()],
+            'output_dir': Path(self.output_path.get()),
+        }
+        
         # Start generation in thread
-        thread = threading.Thread(target=self.generate_speech, args=(text,), daemon=True)
+        thread = threading.Thread(target=self.generate_speech, args=(text,), kwargs=options, daemon=True)
         thread.start()
     
     def stop_generation(self):
-        """Stop generation (placeholder - would need pipeline cancellation)."""
-        self.is_processing = False
-        self.log("Stop requested (generation will finish current segment)...", level="WARNING")
+        """Stop generation; the batch in flight is abandoned at the next submodule boundary."""
+        self._cancel.set()
+        if self.onnx is not None:
+            self.onnx.run_options.terminate = True
+        self.log("Stop requested, keeping the audio generated so far...", level="WARNING")
+    
+    def on_close(self):
+        """Cancel any generation so worker threads stop touching the model, then quit."""
+        self._cancel.set()
+        self.root.destroy()
     
-    def generate_speech(self, text):
-        """Generate speech from text."""
+    def ensure_pipeline(self, lang_code, load_model=True):
+        """Return the G2P pipeline for a language code, creating it on first use.
+        
+        Pipelines are cached per language and built without a model; the one KModel is
+        loaded, cast and compiled on the first call that needs it and shared by every
+        language. The ONNX backend only needs the G2P and passes load_model=False.
+        """
+        with self.pipeline_lock:
+            if load_model and self.model is None:
+                self.log(f"Loading Kokoro-82M model (this may take a moment)...", level="INFO")
+                self.model = KModel(repo_id=KOKORO_REPO_ID).to(self.device).eval()
+                self.half_precision()
+                self.compile_model()
+                self.install_cancel_hooks()
+                if self.device == "cuda":
+                    torch.cuda.empty_cache()  # Drop loader temporaries before the warm-up claims blocks
+            pipeline = self.pipelines.get(lang_code)
+            if pipeline is None:
+                pipeline = KPipeline(lang_code=lang_code, repo_id=KOKORO_REPO_ID, model=False)
+                self.pipelines[lang_code] = pipeline
+                self.log(f"Pipeline initialized successfully (language '{lang_code}')", level="INFO")
+            return pipeline
+    
+    def ensure_onnx(self):
+        """Return the ONNX Runtime session wrapper, loading the ONNX export on first use."""
+        with self.pipeline_lock:
+            if self.onnx is None:
+                self.log(f"Loading Kokoro-82M ONNX model ({OnnxKokoro.MODEL_FILE})...", level="INFO")
+                self.onnx = OnnxKokoro(self.device)
+                providers = ", ".join(self.onnx.session.get_providers())
+                self.log(f"ONNX Runtime providers: {providers}", level="INFO")
+            return self.onnx
+    
+    def _get_voice(self, pipeline, name):
+        """Return the style pack for a voice, loading it onto the device only once."""
+        if name not in self._voice_cache:
+            self._voice_cache[name] = pipeline.load_voice(name).to(self.device)
+        return self._voice_cache[name]
+    
+    def warm_up(self, voice, backend="torch"):
+        """Load the model and voice, then run one tiny forward pass.
+        
+        This moves model download, cuDNN autotuning and lazy CUDA initialization out of
+        the first real generation.
+        """
         try:
-            self.log("Initializing Kokoro pipeline...", level="INFO")
+            if backend == "onnx":
+                self.ensure_pipeline(voice[0], load_model=False)
+                onnx = self.ensure_onnx()
+                with self.pipeline_lock:
+                    onnx.synthesize(self.WARMUP_PHONEMES[0], onnx.voice(voice), 1.0)
+                self.log("ONNX model warm-up complete", level="DEBUG")
+                return
+            pipeline = self.ensure_pipeline(voice[0])
+            with self.pipeline_lock, torch.inference_mode():
+                pack = self._get_voice(pipeline, voice)
+                try:
+                    for phonemes in self.WARMUP_PHONEMES:
+                        self.infer_batch([phonemes], pack, 1.0)
+                except GenerationCancelled:
+                    raise  # Stop during start-up, not a compile failure
+                except Exception as e:
+                    if not self._eager_modules:
+                        raise
+                    self.log(f"torch.compile failed, using the eager model: {e}", level="WARNING")
+                    self.restore_eager_modules()
+                    self.infer_batch([self.WARMUP_PHONEMES[0]], pack, 1.0)
+                self.check_batch_parity(pack)
+                if self.device == "cuda":
+                    # A full batch at the context limit makes the allocator reserve its blocks now
+                    audio, _ = self.infer_batch(["ə" * self.MAX_PHONEMES] * self.BATCH_SIZE, pack, 1.0)
+                    # Staging it through every pooled buffer allocates them up front. They go back
+                    # to the pool even if an allocation fails, or the next generation would block
+                    staged = []
+                    try:
+                        for _ in range(self.PINNED_BUFFERS):
+                            staged.append(self.stage_to_host(audio))
+                    finally:
+                        for _, event, buffer in staged:
+                            event.synchronize()
+                            self._pinned_free.put(buffer)
+                    peak = torch.cuda.memory_stats()["reserved_bytes.all.peak"]
+                    self.log(f"CUDA memory reserved (peak): {peak / 2**20:.0f} MB", level="INFO")
+            self.log("Model warm-up complete", level="DEBUG")
+        except GenerationCancelled:
+            self.log("Model warm-up stopped", level="DEBUG")
+        except Exception as e:
+            self.log(f"Model warm-up failed: {e}", level="WARNING")
+    
+    def check_batch_parity(self, pack):
+        """Compare a chunk synthesized in a padded batch with the same chunk synthesized alone.
+        
+        The short warm-up input goes first in a batch with the long one, so it is the padded
+        sample and, after reseeding, its decoder draws the same noise as the unbatched run.
+        Batching is only used once this has passed. Call with pipeline_lock held.
+        """
+        devices = [torch.cuda.current_device()] if self.device == "cuda" else []
+        outputs = []
+        for phonemes in (list(self.WARMUP_PHONEMES), [self.WARMUP_PHONEMES[0]]):
+            with torch.random.fork_rng(devices=devices):
+                torch.manual_seed(0)
+                audio, lengths = self.infer_batch(phonemes, pack, 1.0)
+            outputs.append(audio[0, :lengths[0]].float().cpu())
+        batched, alone = outputs
+        if batched.shape != alone.shape:
+            error = float("inf")
+        else:
+            error = float((batched - alone).norm() / alone.norm().clamp(min=1e-6))
+        self.batch_verified = error <= self.BATCH_TOLERANCE
+        if self.batch_verified:
+            self.log(f"Batched output matches unbatched (relative error {error:.4f})", level="DEBUG")
+        else:
+            self.log(f"Batched output differs from unbatched (relative error {error:.4f}); "
+                     "generating one segment at a time", level="WARNING")
+    
+    def compile_model(self):
+        """Wrap the heaviest submodules in torch.compile; warm_up() triggers the compile.
+        
+        Inductor fuses the pointwise ops, which only pays off on CUDA. The default mode is used
+        rather than reduce-overhead: every batch has its own token and frame lengths, so CUDA
+        graphs would be re-recorded per shape, and their trees are thread-local while the
+        compiled modules run from the warm-up and inference threads.
+        """
+        if not self.compile_enabled or self.device != "cuda" or not hasattr(torch, "compile"):
+            return
+        model = self.model
+        self._eager_modules = {name: getattr(model, name) for name in self.COMPILED_MODULES}
+        for name, module in self._eager_modules.items():
+            setattr(model, name, torch.compile(module, fullgraph=False, dynamic=True))
+    
+    def restore_eager_modules(self):
+        """Put back the uncompiled submodules after a TorchDynamo/Inductor failure."""
+        for name, module in self._eager_modules.items():
+            setattr(self.model, name, module)
+        self._eager_modules = {}
+        self.install_cancel_hooks()
+    
+    def install_cancel_hooks(self):
+        """Make Stop interrupt a forward pass by raising GenerationCancelled from pre-hooks.
+        
+        Hooks go on the submodules infer_batch calls; hooks on torch.compile wrappers run
+        outside the compiled graph. An eager decoder also gets one per upsampling block,
+        since it dominates each batch's time.
+        """
+        for handle in self._cancel_hooks:
+            handle.remove()
+        model = self.model
+        modules = [model.bert, model.bert_encoder, model.predictor.text_encoder, model.text_encoder,
+                   model.decoder]
+        if "decoder" not in self._eager_modules:
+            modules += [*getattr(model.decoder, "decode", ()), getattr(model.decoder, "generator", None)]
+        self._cancel_hooks = [m.register_forward_pre_hook(self._check_cancel) for m in modules if m is not None]
+    
+    def _check_cancel(self, module, args):
+        if self._cancel.is_set():
+            raise GenerationCancelled()
+    
+    def half_precision(self):
+        """Cast the text and prosody stacks to BF16/FP16 on Tensor Core GPUs.
+        
+        The decoder stays in FP32: its iSTFT head does not support half precision.
+        """
+        model = self.model
+        self.model_dtype = torch.float32
+        if self.device == "cuda":
+            major = torch.cuda.get_device_capability()[0]
+            if major >= 8:
+                self.model_dtype = torch.bfloat16
+            elif major >= 7:
+                self.model_dtype = torch.float16
+        if self.model_dtype != torch.float32:
+            for module in (model.bert, model.bert_encoder, model.predictor, model.text_encoder):
+                module.to(self.model_dtype)
+        self.log(f"Model precision: {str(self.model_dtype).replace('torch.', '')}", level="INFO")
+    
+    def tokenize_chunks(self, lang_code, text):
+        """Split text the way KPipeline does and return the phoneme string of every chunk.
+        
+        Passages are phonemized through the LRU cache, so regenerating after a speed or
+        voice change, or after editing one passage, reruns G2P only where the text changed.
+        """
+        chunks = []
+        for graphemes in _SPLIT_RE.split(text):
+            if graphemes.strip():
+                chunks.extend(self._phonemize(lang_code, graphemes))
+        return chunks
+    
+    def phonemize(self, lang_code, graphemes):
+        """Run G2P on one passage; returns its chunks' phoneme strings (cached as _phonemize)."""
+        pipeline = self.pipelines[lang_code]
+        _, tokens = pipeline.g2p(graphemes)
+        return tuple(ps[:self.MAX_PHONEMES] for _, ps, _ in pipeline.en_tokenize(tokens) if ps)
+    
+    def infer_batch(self, phonemes, pack, speed):
+        """Synthesize several phoneme strings in one padded forward pass.
+        
+        Follows KModel.forward_with_tokens but keeps the batch dimension: padding is masked
+        out of BERT and the encoders, and every sample gets its own duration alignment. The
+        prosody predictor and decoder see no padding at all and run once per sample.
+        Returns the padded (batch, samples) audio on the device and each sample's length.
+        """
+        model = self.model
+        device = model.device
+        with torch.inference_mode():
+            ids = [torch.LongTensor([0, *(model.vocab[p] for p in ps if p in model.vocab), 0])
+                   for ps in phonemes]
+            input_ids = torch.nn.utils.rnn.pad_sequence(ids, batch_first=True).to(device)
+            input_lengths = torch.LongTensor([len(t) for t in ids]).to(device)
+            batch, max_len = input_ids.shape
+            valid = torch.arange(max_len, device=device).unsqueeze(0) < input_lengths.unsqueeze(1)
+            text_mask = ~valid  # Kokoro masks are True on padding
+            ref_s = torch.stack([pack[len(ps) - 1] for ps in phonemes]).squeeze(1).to(device)
+            s = ref_s[:, 128:].to(self.model_dtype)
             
-            # Get parameters
-            voice = self.selected_voice.get()
-            speed = self.speed.get()
-            lang_code = voice[0]  # Extract language code from voice (a=English)
+            # Durations
+            bert_dur = model.bert(input_ids, attention_mask=valid.int())
+            d_en = model.bert_encoder(bert_dur).transpose(-1, -2)
+            d = model.predictor.text_encoder(d_en, s, input_lengths, text_mask)
+            x = torch.nn.utils.rnn.pack_padded_sequence(d, input_lengths.cpu(), batch_first=True,
+                                                        enforce_sorted=False)
+            x, _ = model.predictor.lstm(x)
+            x, _ = torch.nn.utils.rnn.pad_packed_sequence(x, batch_first=True, total_length=max_len)
+            duration = torch.sigmoid(model.predictor.duration_proj(x)).sum(axis=-1) / speed
+            pred_dur = torch.round(duration).clamp(min=1).long().masked_fill(text_mask, 0)
+            frames = pred_dur.sum(dim=1)
             
-            # Initialize pipeline if needed
-            if self.pipeline is None:
-                self.log(f"Loading Kokoro-82M model (this may take a moment)...", level="INFO")
-                self.pipeline = KPipeline(lang_code=lang_code, repo_id="hexgrad/Kokoro-82M", 
-                                         device=self.device)
-                self.log("Pipeline initialized successfully", level="INFO")
+            # Per-sample token-to-frame alignment, zero past each sample's own length
+            pred_aln_trg = torch.zeros(batch, max_len, int(frames.max()), device=device, dtype=d.dtype)
+            positions = torch.arange(max_len, device=device)
+            for b in range(batch):
+                indices = torch.repeat_interleave(positions, pred_dur[b])
+                pred_aln_trg[b, indices, torch.arange(indices.shape[0], device=device)] = 1
             
-            # Process text
-            self.log(f"Processing text with voice '{voice}' at speed {speed:.1f}x...", level="INFO")
-            audio_segments = []
-            segment_count = 0
+            en = d.transpose(-1, -2) @ pred_aln_trg
+            t_en = model.text_encoder(input_ids, input_lengths, text_mask)
+            asr = t_en @ pred_aln_trg
             
-            for gs, ps, audio in self.pipeline(text, voice=voice, speed=speed, 
-                                              split_pattern=r'\n\n\n'):
-                if not self.is_processing:
+            # Prosody and decoding run per sample on its own frames: the bidirectional LSTM and
+            # AdaIN instance norms in F0Ntrain and the decoder would take the padding frames into
+            # their statistics and change every sample shorter than the longest
+            audio = []
+            for b, n in enumerate(frames.tolist()):
+                F0_pred, N_pred = model.predictor.F0Ntrain(en[b:b + 1, :, :n], s[b:b + 1])
+                with torch.autocast("cpu", enabled=False):  # iSTFT head needs FP32 on CPU too
+                    audio.append(model.decoder(asr[b:b + 1, :, :n].float(), F0_pred.float(), N_pred.float(),
+                                               ref_s[b:b + 1, :128].float()).reshape(-1))
+            audio = torch.nn.utils.rnn.pad_sequence(audio, batch_first=True)
+        return audio, [n * self.SAMPLES_PER_FRAME for n in frames.tolist()]
+    
+    def infer_on_stream(self, stream, phonemes, pack, speed):
+        """Run infer_batch on a pool thread, on its own CUDA stream when there is one.
+        
+        Returns (audio, lengths, event marking the end of the batch's kernels or None).
+        """
+        # Grad mode and autocast state are per thread
+        with torch.inference_mode(), torch.autocast("cpu", dtype=torch.bfloat16, enabled=self.cpu_bf16):
+            if stream is None:
+                return (*self.infer_batch(phonemes, pack, speed), None)
+            with torch.cuda.stream(stream):
+                audio, lengths = self.infer_batch(phonemes, pack, speed)
+                done = torch.cuda.Event()
+                done.record()
+            return audio, lengths, done
+    
+    def stage_to_host(self, audio, done=None):
+        """Start copying a batch of audio to the host on the side copy stream.
+        
+        The copy lands in a pinned buffer from the pool, so it can overlap the next batch's
+        forward pass while earlier batches are written out; this blocks while every buffer
+        is still queued for the writer. done is the event recorded on the stream that
+        produced the audio. Returns (host tensor, event, buffer to give back to the pool).
+        """
+        if self.copy_stream is None:
+            return audio.cpu(), None, None
+        buffer = self._pinned_free.get()
+        if buffer is None or buffer.numel() < audio.numel():
+            # Grow geometrically so a run of ever-longer batches reallocates only a few times
+            size = audio.numel() if buffer is None else max(audio.numel(), 2 * buffer.numel())
+            try:
+                buffer = torch.empty(size, dtype=audio.dtype, pin_memory=True)
+            except BaseException:
+                self._pinned_free.put(buffer)  # Keep the pool at PINNED_BUFFERS entries
+                raise
+        host = buffer[:audio.numel()].view(audio.shape)
+        if done is not None:
+            self.copy_stream.wait_event(done)
+        else:
+            self.copy_stream.wait_stream(torch.cuda.current_stream())
+        with torch.cuda.stream(self.copy_stream):
+            host.copy_(audio, non_blocking=True)
+            audio.record_stream(self.copy_stream)  # Keep the allocator from reusing it mid-copy
+            event = torch.cuda.Event()
+            event.record()
+        return host, event, buffer
+    
+    def collect_batch(self, indices, future):
+        """Wait for a submitted batch and stage it to the host; returns a writer queue item."""
+        audio, lengths, done = future.result()
+        return (*self.stage_to_host(audio, done), lengths, indices)
+    
+    def write_loop(self, work, writer, total, errors):
+        """Writer thread: write staged batches from the queue until the None sentinel.
+        
+        After a stop or a write error the rest of the queue is drained unwritten, still
+        handing every pinned buffer back to the pool so the producer never blocks.
+        """
+        while True:
+            item = work.get()
+            if item is None:
+                return
+            host, event, buffer, lengths, indices = item
+            try:
+                if event is not None:
+                    event.synchronize()
+                if not self._cancel.is_set() and not errors:
+                    written = writer.written
+                    for b, (index, length) in enumerate(zip(indices, lengths)):
+                        writer.put(index, host[b, :length].numpy())
+                    # Progress once per 32 segments, so the line is only formatted that often
+                    if writer.written >> 5 != written >> 5:
+                        self.log(f"Processed {writer.written}/{total} segments...", level="DEBUG")
+            except BaseException as e:
+                errors.append(e)
+            finally:
+                if buffer is not None:
+                    self._pinned_free.put(buffer)
+    
+    def plan_batches(self, chunks, batch_size):
+        """Group chunk indices into batches of similar phoneme length.
+        
+        Chunks are sorted by length within windows of BUCKET_WINDOW batches, which cuts
+        padding while bounding how much out-of-order audio the writer has to hold.
+        """
+        if batch_size == 1:
+            return [[i] for i in range(len(chunks))]
+        window = batch_size * self.BUCKET_WINDOW
+        batches = []
+        for start in range(0, len(chunks), window):
+            order = sorted(range(start, min(start + window, len(chunks))), key=lambda i: len(chunks[i]))
+            batches.extend(order[i:i + batch_size] for i in range(0, len(order), batch_size))
+        return batches
+    
+    def synthesize_torch(self, pipeline, sink, chunks, voice, speed, batch_size):
+        """Run the PyTorch model once per batch of chunks and stream the audio to the sink.
+        
+        Batches are written by a separate thread, so encoding and disk I/O overlap the
+        next forward pass. Returns the number of chunks written. Call with pipeline_lock held.
+        """
+        pack = self._get_voice(pipeline, voice)
+        if batch_size > 1 and self.batch_verified is None:
+            self.check_batch_parity(pack)  # Warm-up did not get to it
+        if not self.batch_verified:
+            batch_size = 1
+        writer = ChunkReorderer(sink)
+        work = queue.Queue(maxsize=self.WRITE_QUEUE)
+        errors = []  # Exception raised by the writer thread
+        writer_thread = threading.Thread(target=self.write_loop, args=(work, writer, len(chunks), errors),
+                                         daemon=True)
+        writer_thread.start()
+        in_flight = deque()  # Submitted batches, collected in submission order
+        try:
+            for n, indices in enumerate(self.plan_batches(chunks, batch_size)):
+                if self._cancel.is_set() or errors:
                     break
-                audio_segments.append(audio)
-                segment_count += 1
-                if segment_count % 10 == 0:
-                    self.log(f"Processed {segment_count} segments...", level="DEBUG")
-            
-            if not audio_segments:
-                raise RuntimeError("No audio generated")
+                stream = self.infer_streams[n % len(self.infer_streams)]
+                in_flight.append((indices, self.infer_pool.submit(
+                    self.infer_on_stream, stream, [chunks[i] for i in indices], pack, speed)))
+                if len(in_flight) == len(self.infer_streams):
+                    work.put(self.collect_batch(*in_flight.popleft()))
+            while in_flight:
+                work.put(self.collect_batch(*in_flight.popleft()))
+        except GenerationCancelled:
+            pass  # Stop pressed mid-batch; what was already written is the result
+        finally:
+            for _, future in in_flight:
+                future.exception()  # Let abandoned batches unwind before the lock is released
+            work.put(None)
+            writer_thread.join()
+        if errors:
+            raise errors[0]
+        return writer.written
+    
+    def synthesize_onnx(self, onnx, sink, chunks, voice, speed):
+        """Run the ONNX export once per chunk and stream the audio to the sink.
+        
+        Returns the number of chunks written. Call with pipeline_lock held.
+        """
+        pack = onnx.voice(voice)
+        segment_count = 0
+        onnx.run_options.terminate = False
+        for ps in chunks:
+            if self._cancel.is_set():
+                break
+            try:
+                audio = onnx.synthesize(ps, pack, speed)
+            except Exception:
+                if self._cancel.is_set():
+                    break  # Run aborted by stop_generation
+                raise
+            sink.write(audio)
+            segment_count += 1
+            if segment_count & 31 == 0:
+                self.log(f"Processed {segment_count}/{len(chunks)} segments...", level="DEBUG")
+        return segment_count
+    
+    def generate_speech(self, text, voice, speed, backend, batch_size, mp3, mp3_quality, wav_subtype, output_dir):
+        """Generate speech from text; runs on a worker thread with options read by start_generation."""
+        try:
+            self.log("Initializing Kokoro pipeline...", level="INFO")
             
-            # Concatenate audio
-            self.log("Concatenating audio segments...", level="INFO")
-            final_audio = np.concatenate(audio_segments)
-            self.log(f"Generated {len(final_audio)} samples at 24kHz", level="INFO")
+            # Language code from voice (a=English); ONNX only needs the G2P
+            pipeline = self.ensure_pipeline(voice[0], load_model=backend != "onnx")
+            onnx = self.ensure_onnx() if backend == "onnx" else None
             
-            # Save audio
-            output_format = self.output_format.get()
-            output_dir = Path(self.output_path.get())
+            # Stream audio straight to a partial file; it is renamed once the segment count is known.
+            # A unique name in output_dir keeps two runs apart and makes the rename a same-volume os.replace
             output_dir.mkdir(parents=True, exist_ok=True)
+            extension = "mp3" if mp3 else "wav"
+            fd, temp_path = tempfile.mkstemp(suffix=f".{extension}", prefix="temp_kokoro_", dir=output_dir)
+            os.close(fd)
+            try:
+                sink = AudioSink(temp_path, 24000, mp3=mp3, mp3_quality=mp3_quality, subtype=wav_subtype)
+            except BaseException:
+                os.unlink(temp_path)
+                raise
             
-            # Get voice name for filename
-            voice = self.selected_voice.get()
+            # Process text
+            self.log(f"Processing text with voice '{voice}' at speed {speed:.1f}x ({backend})...", level="INFO")
             
-            if output_format == "mp3" and self.has_ffmpeg:
-                # Save as WAV first, then convert to MP3
-                temp_wav = output_dir / "temp_kokoro_output.wav"
-                sf.write(str(temp_wav), final_audio, 24000)
+            try:
+                # Tokenize everything up front; grad mode is per thread, so the worker needs
+                # its own inference_mode
+                with self.pipeline_lock, torch.inference_mode():
+                    chunks = self.tokenize_chunks(voice[0], text)
+                    if onnx is not None:
+                        segment_count = self.synthesize_onnx(onnx, sink, chunks, voice, speed)
+                    else:
+                        segment_count = self.synthesize_torch(pipeline, sink, chunks, voice, speed,
+                                                              batch_size)
                 
-                output_file = output_dir / f"kokoro_{voice}_{segment_count}.mp3"
-                self.log(f"Converting to MP3...", level="INFO")
-                subprocess.run([
-                    'ffmpeg', '-i', str(temp_wav), '-acodec', 'libmp3lame',
-                    '-ab', '192k', '-y', str(output_file)
-                ], check=True, capture_output=True)
-                os.remove(temp_wav)
-            else:
-                # Save as WAV
-                output_file = output_dir / f"kokoro_{voice}_{segment_count}.wav"
-                sf.write(str(output_file), final_audio, 24000)
+                if not segment_count:
+                    if self._cancel.is_set():
+                        raise GenerationCancelled()
+                    raise RuntimeError("No audio generated")
+                if self._cancel.is_set():
+                    self.log(f"Stopped after {segment_count}/{len(chunks)} segments", level="WARNING")
+                self.log(f"Generated {sink.samples} samples at 24kHz", level="INFO")
+                if mp3:
+                    self.log(f"Finishing MP3 encode...", level="INFO")
+                sink.close()
+            except BaseException:
+                sink.abort()
+                raise
+            
+            output_file = output_dir / f"kokoro_{voice}_{segment_count}.{extension}"
+            os.chmod(sink.path, 0o666 & ~_UMASK)  # mkstemp creates files as 0600
+            os.replace(sink.path, output_file)
             
             # Success
-            duration = len(final_audio) / 24000
+            duration = sink.samples / 24000
             file_size = output_file.stat().st_size / 1024  # KB
             self.log(f"[SUCCESS] Audio saved: {output_file.name}", level="INFO")
             self.log(f"  Duration: {duration:.2f} seconds", level="INFO")
@@ -869,6 +1794,8 @@ class KokoroTTSApp:
                 output_file, output_dir, duration
             ))
             
+        except GenerationCancelled:
+            self.log("Generation stopped before any audio was produced", level="WARNING")
         except Exception as e:
             error_msg = f"Error during generation: {e}"
             self.log(error_msg, level="ERROR")
@@ -883,19 +1810,9 @@ class KokoroTTSApp:
 
 def main():
     """Main entry point."""
-    if not KOKORO_AVAILABLE:
-        root = tk.Tk()
-        root.withdraw()
-        messagebox.showerror(
-            "Missing Dependency",
-            "Kokoro package is not installed.\n\n"
-            "Please install it with:\n"
-            "pip install kokoro numpy soundfile"
-        )
-        sys.exit(1)
-    
     root = tk.Tk()
     app = KokoroTTSApp(root)
+    root.protocol("WM_DELETE_WINDOW", app.on_close)
     root.mainloop()
 
 
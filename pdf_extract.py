@@ -0,0 +1,53 @@
+"""
+PDF text extraction for kokoro_converter's worker processes.
+
+Kept apart from the GUI module and imports nothing but PyMuPDF: the tasks pickle as
+references to this module, so workers forked from the Linux fork server, and those of
+the frozen build, only import fitz. Workers spawned for a plain script on Windows and
+macOS still re-import the main script first, as multiprocessing always does there.
+"""
+import fitz  # PyMuPDF
+
+
+def choose_strategy(n_pages):
+    """
+    Picks how a PDF is split for extraction and synthesis, following pdf-parse-new's
+    page-count buckets. Returns (chunk_pages, use_procs).
+    """
+    if n_pages <= 10:
+        # Tiny documents are extracted and synthesized in a single shot.
+        return max(n_pages, 1), False
+    if n_pages <= 500:
+        # Medium documents are streamed in ~200 page chunks.
+        return 200, False
+    # Large documents extract the upcoming chunks in the worker pool.
+    return 200, True
+
+# Let MuPDF expand ligatures and turn odd whitespace into plain spaces in C, so the TTS
+# frontend gets clean words ("ﬁ" -> "fi") without another normalization pass.
+TEXT_FLAGS = fitz.TEXTFLAGS_TEXT & ~fitz.TEXT_PRESERVE_LIGATURES & ~fitz.TEXT_PRESERVE_WHITESPACE
+
+def extract_pages(path, start=0, stop=None):
+    """
+    Extracts the text of pages [start, stop) of a PDF, separated by form feeds (chr(12)).
+    Runs in a worker process so parsing overlaps with TTS. When stop is None the first
+    chunk chosen by choose_strategy is extracted. Returns (text, stop, page_count).
+    """
+    # The with block releases the MuPDF handles as soon as the chunk is read. An explicit
+    # filetype skips format sniffing, and page_count only needs the xref, not the pages.
+    with fitz.open(path, filetype='pdf') as doc:
+        page_count = doc.page_count
+        if stop is None:
+            stop = start + choose_strategy(page_count)[0]
+        stop = min(stop, page_count)
+        # Pages are loaded one at a time and dropped right away, so only one page's text
+        # layout is alive at once. sort=False skips MuPDF's geometric sort pass. Blank and
+        # image-only pages are dropped.
+        parts = []
+        for i in range(start, stop):
+            page = doc.load_page(i)
+            page_text = page.get_text('text', flags=TEXT_FLAGS, sort=False)
+            page = None
+            if page_text.strip():
+                parts.append(page_text)
+    return chr(12).join(parts), stop, page_count